@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+import asyncssh
+
+DEFAULT_COMMANDS = "terminal length 0,show version | json,show running-config"
+
+
+def _parse_args():
+    """ Entrypoint
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument(
+        "-b",
+        "--base-port",
+        default=2200,
+        type=int,
+        help="Base port for the SSH server.",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--server-count",
+        default=1,
+        type=int,
+        help="The number of SSH servers, clients are spread across them.",
+    )
+
+    parser.add_argument(
+        "-d",
+        "--directory",
+        default="./examples/configs",
+        help="The path to the device/commands directories.",
+    )
+
+    parser.add_argument(
+        "-k",
+        "--ssh_key",
+        default="./test_rsa.key",
+        help="Server side SSH key file path",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--server-args",
+        default="",
+        help="Additional arguments for server.py, e.g. '-w 4'.",
+    )
+
+    parser.add_argument(
+        "--no-server",
+        action="store_true",
+        help="Benchmark an already running server instead of starting one.",
+    )
+
+    parser.add_argument(
+        "-n",
+        "--clients",
+        default=50,
+        type=int,
+        help="The number of concurrent clients.",
+    )
+
+    parser.add_argument(
+        "-i",
+        "--iterations",
+        default=10,
+        type=int,
+        help="The number of times each client runs the commands.",
+    )
+
+    parser.add_argument(
+        "--hosts",
+        type=lambda s: [item for item in s.split(",")],
+        default="eos101",
+        help="The devices the clients log in as, assigned round robin.",
+    )
+
+    parser.add_argument(
+        "--commands",
+        type=lambda s: [item for item in s.split(",")],
+        default=DEFAULT_COMMANDS,
+        help="The commands each client runs per iteration.",
+    )
+
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as json."
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _summary(values):
+    return {
+        "count": len(values),
+        "p50_ms": _percentile(values, 50) * 1000,
+        "p90_ms": _percentile(values, 90) * 1000,
+        "p99_ms": _percentile(values, 99) * 1000,
+        "max_ms": max(values, default=0) * 1000,
+    }
+
+
+def _rss_kb(pid):
+    """ the resident and peak resident memory of pid and its children
+    """
+    totals = {"rss_kb": 0, "peak_rss_kb": 0}
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open("/proc/{}/status".format(current)) as fhand:
+                for line in fhand:
+                    if line.startswith("VmRSS:"):
+                        totals["rss_kb"] += int(line.split()[1])
+                    elif line.startswith("VmHWM:"):
+                        totals["peak_rss_kb"] += int(line.split()[1])
+            with open("/proc/{0}/task/{0}/children".format(current)) as fhand:
+                pids.extend(int(child) for child in fhand.read().split())
+        except FileNotFoundError:
+            continue
+    return totals
+
+
+def _start_server(args):
+    command = [
+        sys.executable,
+        "server.py",
+        "-k",
+        args.ssh_key,
+        "-d",
+        args.directory,
+        "-b",
+        str(args.base_port),
+        "-c",
+        str(args.server_count),
+    ] + shlex.split(args.server_args)
+    server = subprocess.Popen(
+        command,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    for port in range(args.base_port, args.base_port + args.server_count):
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError("server.py exited during startup")
+            try:
+                socket.create_connection(("localhost", port), 1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    server.terminate()
+                    raise
+                time.sleep(0.1)
+    return server
+
+
+async def _read_prompt(process, prompt):
+    chunks = []
+    tail = ""
+    while not tail.endswith(prompt):
+        chunk = await process.stdout.read(65536)
+        if not chunk:
+            raise ConnectionError("Session closed before the prompt")
+        chunks.append(chunk)
+        tail = (tail + chunk)[-len(prompt) :]
+    return sum(len(chunk) for chunk in chunks)
+
+
+async def _client(args, idx, results):
+    host = args.hosts[idx % len(args.hosts)]
+    port = args.base_port + idx % args.server_count
+    prompt = host + "#"
+    start = time.perf_counter()
+    async with asyncssh.connect(
+        "localhost",
+        port,
+        username="bench::{}".format(host),
+        password="bench",
+        known_hosts=None,
+    ) as conn:
+        process = await conn.create_process(term_type="vt100")
+        await _read_prompt(process, prompt)
+        results["connect"].append(time.perf_counter() - start)
+        for _iteration in range(args.iterations):
+            for command in args.commands:
+                start = time.perf_counter()
+                process.stdin.write(command + "\n")
+                results["bytes"] += await _read_prompt(process, prompt)
+                results["commands"][command].append(
+                    time.perf_counter() - start
+                )
+        process.stdin.write("exit\n")
+
+
+async def _run(args):
+    results = {
+        "connect": [],
+        "commands": {command: [] for command in args.commands},
+        "bytes": 0,
+        "errors": 0,
+    }
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *[_client(args, idx, results) for idx in range(args.clients)],
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            results["errors"] += 1
+            LOGGER.error("Client failed: %s", outcome)
+    return results, elapsed
+
+
+def main():
+    args = _parse_args()
+    server = None if args.no_server else _start_server(args)
+    try:
+        results, elapsed = asyncio.run(_run(args))
+        memory = _rss_kb(server.pid) if server else {}
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    latencies = [
+        value for values in results["commands"].values() for value in values
+    ]
+    report = {
+        "clients": args.clients,
+        "iterations": args.iterations,
+        "errors": results["errors"],
+        "elapsed_s": elapsed,
+        "commands_per_s": len(latencies) / elapsed,
+        "bytes_per_s": results["bytes"] / elapsed,
+        "connect": _summary(results["connect"]),
+        "all_commands": _summary(latencies),
+        "commands": {
+            command: _summary(values)
+            for command, values in results["commands"].items()
+        },
+        "server": memory,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        "{clients} clients x {iterations} iterations in {elapsed_s:.2f}s,"
+        " {commands_per_s:.1f} commands/s, {errors} errors".format(**report)
+    )
+    rows = [("connection setup", report["connect"])]
+    rows.append(("all commands", report["all_commands"]))
+    rows.extend(report["commands"].items())
+    print(
+        "{:<40}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+            "", "count", "p50 ms", "p90 ms", "p99 ms", "max ms"
+        )
+    )
+    for name, summary in rows:
+        print(
+            "{:<40}{count:>8}{p50_ms:>10.2f}{p90_ms:>10.2f}"
+            "{p99_ms:>10.2f}{max_ms:>10.2f}".format(name[:39], **summary)
+        )
+    if memory:
+        print(
+            "server rss {rss_kb} kB, peak {peak_rss_kb} kB".format(**memory)
+        )
+
+
+if __name__ == "__main__":
+    LOGGER = logging.getLogger()
+    logging.basicConfig(level=logging.WARNING)
+    main()
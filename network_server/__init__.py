@@ -1,20 +1,127 @@
+import asyncio
+from collections import OrderedDict
+import functools
 import logging
-import re
-from typing import Pattern
+import os
+import sys
+import time
+import weakref
 import asyncssh
 
+from network_server.admission import ADMISSION
+from network_server.catalog import CATALOG
+from network_server.config_tree import OVERLAYS
+from network_server.content_cache import CONTENT_CACHE
+from network_server.dispatch import CommandTable
+from network_server.filters import split_pipe
+from network_server.metrics import METRICS
+from network_server.plugins import PluginBase
 from network_server.plugins.show_file_server import ShowFileServer
 from network_server.plugins.configure import Configure
 from network_server.plugins.help import Help
 from network_server.plugins.history import History
+from network_server.plugins.stats import Stats
+from network_server.timing import TIMING, paced
 
 PLUGIN_REF = {
     "confmode": Configure,
     "showfs": ShowFileServer,
     "help": Help,
     "history": History,
+    "stats": Stats,
 }
 
+TABLES = {}
+# the keys of the tables for hostnames not in the catalog, least recently
+# used first, any hostname can be asked for so only so many are kept
+UNLISTED = OrderedDict()
+UNLISTED_TABLES = 256
+SESSIONS = weakref.WeakSet()
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as fhand:
+            return int(fhand.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+METRICS.add_collector(
+    lambda: {
+        "mock_cache_{}".format(key): value
+        for key, value in CONTENT_CACHE.stats().items()
+    }
+)
+METRICS.add_collector(
+    lambda: {
+        "mock_devices": len(CATALOG.devices()),
+        "mock_command_tables": len(TABLES),
+        "mock_config_overlays": sum(1 for o in OVERLAYS.values() if o),
+    }
+)
+METRICS.add_collector(
+    lambda: {
+        "mock_session_state_bytes": sum(
+            session.footprint() for session in list(SESSIONS)
+        ),
+        "mock_rss_bytes": _rss_bytes(),
+    }
+)
+
+
+def command_table(hostname, plugins, directory):
+    """ the compiled command table for a device, built once and shared
+    by all of its sessions
+
+    Table entries reference the plugin class, sessions create their own
+    plugin instances on first use. A table is rebuilt when the catalog
+    entry for the device changes. Only the UNLISTED_TABLES most recently
+    used tables of hostnames not in the catalog are kept.
+    """
+    key = (hostname, tuple(plugins))
+    version = CATALOG.version(hostname)
+    cached = TABLES.get(key)
+    if cached is not None and cached[0] == version:
+        if key in UNLISTED:
+            UNLISTED.move_to_end(key)
+        return cached[1]
+    commands = {}
+    keystrokes = {}
+    observers = []
+    for name, plugin in PLUGIN_REF.items():
+        if name not in plugins:
+            continue
+        prototype = plugin(
+            commands=commands,
+            directory=directory,
+            hostname=hostname,
+            process=None,
+            username=None,
+        )
+        for command in prototype.commands():
+            commands[command] = {
+                "plugin": plugin,
+                "name": getattr(command, "pattern", command),
+            }
+        for keystroke in prototype.keystrokes():
+            keystrokes[keystroke] = plugin
+        if plugin.observe_command is not PluginBase.observe_command:
+            observers.append(plugin)
+        logging.getLogger("SSHSession").info(
+            "%s: Enabled plugin: %s", hostname, plugin.__name__
+        )
+    table = CommandTable(commands, keystrokes, observers)
+    TABLES[key] = (version, table)
+    if CATALOG.version(hostname)[0] is None:
+        UNLISTED[key] = None
+        UNLISTED.move_to_end(key)
+        while len(UNLISTED) > UNLISTED_TABLES:
+            del TABLES[UNLISTED.popitem(last=False)[0]]
+    else:
+        UNLISTED.pop(key, None)
+    return table
+
 
 async def ssh_session(process):
     """ kick off the ssh session and hand off
@@ -24,107 +131,323 @@ async def ssh_session(process):
         username, hostname = username.split("::")
     else:
         hostname = "mock"
+    if not ADMISSION.admit_device(hostname):
+        process.stderr.write(
+            "% Too many sessions to {}, try again later\r\n".format(hostname)
+        )
+        process.exit(1)
+        return
+    try:
+        await _run_session(process, username, hostname)
+    finally:
+        ADMISSION.release_device(hostname)
+
+
+async def _run_session(process, username, hostname):
+    """ run an admitted session
+    """
     session = SSHSession(
         username, hostname, process, **process.get_extra_info("user_args")
     )
-    # pylint: disable=W0212
-    while process.channel._send_state == "open":
-        try:
-            while process.channel._send_state == "open":
-                res = await session.interactive()
-                if not res:
-                    process.exit(0)
-        except asyncssh.BreakReceived:
-            process.stdout.write("\r\n")
+    METRICS.observe(
+        "mock_connection_setup_seconds",
+        time.perf_counter() - process.get_extra_info("connected_at"),
+    )
+    METRICS.inc("mock_sessions_total")
+    METRICS.gauge("mock_active_sessions", 1)
+    try:
+        if process.command is not None:
+            # exec request, answer from the command table and exit
+            res = await session.execute(process.command)
+            process.exit(0 if res else 1)
+            return
+        # pylint: disable=W0212
+        while process.channel._send_state == "open":
+            try:
+                while process.channel._send_state == "open":
+                    res = await session.interactive()
+                    if not res:
+                        process.exit(0)
+            except asyncssh.BreakReceived:
+                process.stdout.write("\r\n")
+    finally:
+        METRICS.gauge("mock_active_sessions", -1)
+
+
+async def string_chunks(output, size):
+    """ split a large string into chunks of at most size
+    """
+    for start in range(0, len(output), size):
+        yield output[start : start + size]
 
 
-class SSHSession:  # pylint: disable=R0902, R0903
+class SSHSession:
     """ ssh session
+
+    Sessions are kept small, tens of thousands may be idle at once. The
+    command table and prompt are shared by the device's sessions and
+    plugin instances are only created when first used.
     """
 
+    __slots__ = (
+        "_username",
+        "_hostname",
+        "_context",
+        "_directory",
+        "_plugins",
+        "_instances",
+        "_process",
+        "_prompt",
+        "_exec",
+        "_table",
+        "_client",
+        "__weakref__",
+    )
+
+    # the most output written to the channel before waiting for it to drain
+    CHUNK_SIZE = 64 * 1024
+    _logger = logging.getLogger("SSHSession")
+
     def __init__(self, *args, **kwargs):
         self._username = args[0]
         self._hostname = args[1]
         self._context = False
         self._directory = kwargs["directory"]
         self._plugins = kwargs["enable_plugins"]
-        self._commands = {}
-        self._keystrokes = {}
+        self._instances = None
         self._process = args[2]
-        self._prompt = self._hostname + "#"
-        self._logger = logging.getLogger(self.__class__.__name__)
+        self._client = self._process.get_extra_info("client")
+        self._exec = False
         if "cmdrunner" in self._plugins:
             from network_server.plugins.command_runner import CommandRunner
 
             PLUGIN_REF["cmdrunner"] = CommandRunner
-        self._load_plugins()
+        self._table = command_table(
+            self._hostname, self._plugins, self._directory
+        )
+        self._prompt = self._table.cache.setdefault(
+            "prompt", self._hostname + "#"
+        )
+        SESSIONS.add(self)
+
+    def footprint(self):
+        """ the bytes held by the session itself, not counting the
+        shared command table or the connection
+        """
+        size = sys.getsizeof(self)
+        if self._instances:
+            size += sys.getsizeof(self._instances) + sum(
+                plugin.footprint() for plugin in self._instances.values()
+            )
+        return size
 
     async def interactive(self):
         """ go interactive with the client
         """
         self._process.stdout.write("\r\n" + self._prompt)
+        if getattr(self._process.channel, "_editor", None) is not None:
+            for key, plugin in self._table.keystrokes.items():
+                self._process.channel.register_key(
+                    key, functools.partial(self._keystroke, plugin, key)
+                )
 
         while True:
-            user_input = await self._process.stdin.readline()
+            try:
+                user_input = await asyncio.wait_for(
+                    self._process.stdin.readline(),
+                    ADMISSION.idle_timeout or None,
+                )
+            except asyncio.TimeoutError:
+                METRICS.inc("mock_idle_closed_total")
+                self._process.stdout.write(
+                    "\r\n% Idle timeout, closing the session\r\n"
+                )
+                break
             if user_input == "":
                 break
-            res = await self._handle_command(user_input.rstrip())
+            line = user_input.rstrip()
+            for plugin in self._table.observers:
+                self._plugin(plugin).observe_command(line)
+            res = await self._handle_command(line)
             if not res:
                 break
 
+    async def execute(self, command):
+        """ run the command(s) of an exec request without prompts
+
+        :return: False if a command was not found or was over the
+            client's command rate
+        """
+        self._exec = True
+        for line in command.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if self._context or self._lookup(line):
+                if not await self._handle_command(line):
+                    return False
+            else:
+                self._process.stderr.write(
+                    "% Invalid command: '{}'\n".format(line)
+                )
+                return False
+        return True
+
     async def _handle_command(self, line):  # pylint: disable=R0911
+        if not ADMISSION.allow_command(self._client):
+            message = "% Command rate exceeded, try again later\n"
+            if self._exec:
+                # fail the exec request rather than pass this as output
+                self._process.stderr.write(message)
+                return False
+            self._process.stdout.write(message)
+            await self._send_prompt()
+            return True
         # if in a context send all commands that way
         if self._context:
-            response = await self._context.execute_command(line)
-            await self._respond(response)
-            return True
-        # check for exact match
-        if line in self._commands:
-            response = await self._commands[line]["plugin"].execute_command(
-                line
-            )
-            await self._respond(response)
+            await self._execute(self._context, line, "<context>")
             return True
-        # check the regexs
-        matches = [
-            val
-            for k, val in self._commands.items()
-            if isinstance(k, Pattern) and re.match(k, line)
-        ]
-        if matches:
-            response = await matches[0]["plugin"].execute_command(line)
-            await self._respond(response)
+        # exact match, the plugin regexs, then abbreviations
+        match = self._lookup(line)
+        if match:
+            command, entry, line_filter = match
+            plugin = self._plugin(entry["plugin"])
+            await self._execute(plugin, command, entry["name"], line_filter)
             return True
 
         if line == "exit":
             return False
 
+        METRICS.inc("mock_unmatched_total")
         self._logger.info("%s: No match for '%s'", self._hostname, line)
         await self._send_prompt()
         return True
 
-    def _load_plugins(self):
-        plugins = [val for k, val in PLUGIN_REF.items() if k in self._plugins]
-        for plugin in plugins:
+    def _lookup(self, line):
+        """ find the command table entry for line, a line with a trailing
+        filter that has no entry of its own is looked up without it
+
+        :return: (command, entry, the LineFilter or None) or None
+        """
+        match = self._table.lookup(line)
+        if match:
+            return match + (None,)
+        piped = split_pipe(line)
+        if piped is None:
+            return None
+        base, line_filter = piped
+        match = self._table.lookup(base)
+        if match:
+            return match + (line_filter,)
+        return None
+
+    async def _execute(self, plugin, line, name, line_filter=None):
+        """ run a command through a plugin and respond, recording the
+        plugin, response and overall latency
+
+        :param name: the command table key, used as the command label
+        :param line_filter: applied to the command output
+        """
+        start = time.perf_counter()
+        response = await plugin.execute_command(line)
+        if line_filter is not None and response["output"]:
+            response["output"] = line_filter.apply(response["output"])
+        executed = time.perf_counter()
+        timing = TIMING.profile(self._hostname, line)
+        if timing is not None:
+            # the emulated latency includes the time the plugin took
+            delay = timing.delay() - (executed - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await self._respond(response, timing.rate if timing else 0)
+        end = time.perf_counter()
+        plugin_name = plugin.__class__.__name__
+        METRICS.observe(
+            "mock_plugin_seconds", executed - start, plugin=plugin_name
+        )
+        METRICS.observe("mock_respond_seconds", end - executed)
+        METRICS.observe(
+            "mock_command_seconds",
+            end - start,
+            plugin=plugin_name,
+            command=name,
+        )
+
+    def _keystroke(self, plugin, key, line, pos):
+        """ called by the line editor when a registered key is pressed
+
+        :return: the new input line and cursor position, True to insert
+            the key as typed or False to ring the bell
+        """
+        if self._context:
+            # plugin contexts take the key as typed
+            return True
+        result = self._plugin(plugin).execute_keystroke(key, line, pos)
+        if result is None:
+            return False
+        output, line, pos = result
+        if output:
+            # the editor redraws the input line after the prompt
+            self._process.stdout.write(output + self._prompt)
+        return line, pos
+
+    def _plugin(self, plugin):
+        """ the session's instance of a plugin, created on first use
+        """
+        if self._instances is None:
+            self._instances = {}
+        plugin_initd = self._instances.get(plugin)
+        if plugin_initd is None:
             plugin_initd = plugin(
-                commands=self._commands,
+                commands=self._table.commands,
                 directory=self._directory,
                 hostname=self._hostname,
                 process=self._process,
+                table=self._table,
                 username=self._username,
             )
-            commands = plugin_initd.commands()
-            for command in commands:
-                self._commands[command] = {"plugin": plugin_initd}
-            self._logger.info("Enabled plugin: %s", plugin.__name__)
+            self._instances[plugin] = plugin_initd
+        return plugin_initd
 
-    async def _respond(self, response):
-        self._process.stdout.write(response["output"])
+    async def _respond(self, response, rate=0):
+        """
+        :param rate: the output bytes per second, 0 for unpaced
+        """
+        if response["output"]:
+            await self._write(response["output"], rate)
         self._context = response["context"]
         if response["new_prompt"]:
             self._prompt = response["new_prompt"]
         if response["prompt"]:
             await self._send_prompt()
 
+    async def _write(self, output, rate=0):
+        """ write a pre-rendered string or the chunks of an async iterator,
+        waiting for the channel to drain between chunks
+
+        :param rate: pace the output at this many bytes per second
+        """
+        stdout = self._process.stdout
+        if rate:
+            output = paced(output, rate)
+        elif isinstance(output, str):
+            if len(output) <= self.CHUNK_SIZE:
+                stdout.write(output)
+                METRICS.inc("mock_output_bytes_total", len(output))
+                await stdout.drain()
+                return
+            output = string_chunks(output, self.CHUNK_SIZE)
+        try:
+            async for chunk in output:
+                stdout.write(chunk)
+                METRICS.inc("mock_output_bytes_total", len(chunk))
+                await stdout.drain()
+        finally:
+            # plain async iterators have nothing to close
+            close = getattr(output, "aclose", None)
+            if close is not None:
+                await close()
+
     async def _send_prompt(self):
-        self._process.stdout.write(self._prompt)
+        if not self._exec:
+            self._process.stdout.write(self._prompt)
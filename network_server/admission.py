@@ -0,0 +1,140 @@
+""" Session caps and per client command rate limits
+"""
+import math
+import time
+
+from network_server.metrics import METRICS
+
+
+class TokenBucket:
+    """ allow rate events per second with bursts of up to burst
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.last) * self.rate
+        )
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class AdmissionControl:
+    """ admission control for the whole process
+
+    A limit of 0 is unlimited. Connections over the global or listener
+    cap are refused before authentication, sessions over the device cap
+    are closed with a message, and commands over a client's rate are
+    answered with an error instead of being run. Clients are told apart
+    by their address and keep their bucket across connections, a bucket
+    is dropped once it has been idle long enough to have refilled.
+    """
+
+    # the most seconds between sweeps for refilled buckets
+    EXPIRE_INTERVAL = 60
+
+    def __init__(self):
+        self.max_sessions = 0
+        self.max_listener_sessions = 0
+        self.max_device_sessions = 0
+        self.idle_timeout = 0
+        self.command_rate = 0
+        self.command_burst = 0
+        self._total = 0
+        self._listeners = {}
+        self._devices = {}
+        # client address -> TokenBucket
+        self._buckets = {}
+        self._expired = time.monotonic()
+
+    def configure(self, **limits):
+        for name, value in limits.items():
+            setattr(self, name, value)
+
+    def _reject(self, reason):
+        METRICS.inc("mock_rejected_total", reason=reason)
+        return False
+
+    def admit_connection(self, port):
+        """ count a new connection against the caps
+
+        :return: False if it is over a cap and must be refused
+        """
+        if self.max_sessions and self._total >= self.max_sessions:
+            return self._reject("max_sessions")
+        listener = self._listeners.get(port, 0)
+        if self.max_listener_sessions and (
+            listener >= self.max_listener_sessions
+        ):
+            return self._reject("max_listener_sessions")
+        self._total += 1
+        self._listeners[port] = listener + 1
+        return True
+
+    def release_connection(self, port):
+        self._total -= 1
+        self._listeners[port] -= 1
+
+    def admit_device(self, hostname):
+        """ count a new session to a device
+
+        :return: False if the device has too many sessions
+        """
+        sessions = self._devices.get(hostname, 0)
+        if self.max_device_sessions and sessions >= self.max_device_sessions:
+            return self._reject("max_device_sessions")
+        self._devices[hostname] = sessions + 1
+        return True
+
+    def release_device(self, hostname):
+        sessions = self._devices[hostname] - 1
+        if sessions:
+            self._devices[hostname] = sessions
+        else:
+            del self._devices[hostname]
+
+    def _expire(self, now):
+        """ drop the buckets that are full again, a new bucket for the
+        client would be the same
+        """
+        self._expired = now
+        self._buckets = {
+            client: bucket
+            for client, bucket in self._buckets.items()
+            if (now - bucket.last) * bucket.rate < bucket.burst
+        }
+
+    def allow_command(self, client):
+        """ take a token from the client's bucket
+
+        :return: False if the client is over its command rate
+        """
+        if not self.command_rate:
+            return True
+        now = time.monotonic()
+        if now - self._expired >= self.EXPIRE_INTERVAL:
+            self._expire(now)
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            # a burst under one token would refuse every command
+            bucket = self._buckets[client] = TokenBucket(
+                self.command_rate,
+                max(1, self.command_burst or math.ceil(self.command_rate)),
+            )
+        if bucket.take():
+            return True
+        return self._reject("command_rate")
+
+
+ADMISSION = AdmissionControl()
@@ -1,14 +1,42 @@
+import time
 import asyncssh
 from network_server import ssh_session
+from network_server.admission import ADMISSION
+
+
+def server_options(**kwargs):
+    """ build the connection options shared by every listener
+
+    The host key is read, or generated when no key file is provided,
+    a single time.
+    """
+    if kwargs.get("ssh_key"):
+        host_key = asyncssh.read_private_key(kwargs["ssh_key"])
+    else:
+        host_key = asyncssh.generate_private_key(kwargs["host_key_type"])
+    algs = {
+        name: kwargs[name]
+        for name in ("kex_algs", "encryption_algs", "mac_algs")
+        if kwargs.get(name)
+    }
+    return asyncssh.SSHServerConnectionOptions(
+        server_host_keys=[host_key],
+        process_factory=ssh_session,
+        line_editor=kwargs.get("line_editor", True),
+        line_history=kwargs.get("history_size", 100),
+        keepalive_interval=kwargs.get("keepalive_interval") or None,
+        **algs
+    )
 
 
 async def start_server(*args, **kwargs):
+    options = kwargs.pop("options")
     await asyncssh.create_server(
-        lambda: SSHServer(**kwargs),
+        lambda: SSHServer(port=args[0], **kwargs),
         "",
         args[0],
-        server_host_keys=kwargs["ssh_key"],
-        process_factory=ssh_session,
+        options=options,
+        reuse_port=kwargs.get("reuse_port", False),
     )
 
 
@@ -17,9 +45,28 @@ class SSHServer(asyncssh.SSHServer):
         self._valid_username = kwargs["username"]
         self._valid_password = kwargs["password"]
         self._kwargs = kwargs
+        self._port = kwargs["port"]
+        self._client = None
 
     def connection_made(self, conn):
-        conn.set_extra_info(user_args=self._kwargs)
+        client = (conn.get_extra_info("peername") or ("",))[0]
+        if not ADMISSION.admit_connection(self._port):
+            conn.disconnect(
+                asyncssh.DISC_TOO_MANY_CONNECTIONS,
+                "Too many sessions, try again later",
+            )
+            return
+        self._client = client
+        conn.set_extra_info(
+            user_args=self._kwargs,
+            connected_at=time.perf_counter(),
+            client=client,
+        )
+
+    def connection_lost(self, exc):
+        if self._client is not None:
+            ADMISSION.release_connection(self._port)
+            self._client = None
 
     @staticmethod
     def password_auth_supported():
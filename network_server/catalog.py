@@ -0,0 +1,199 @@
+""" A process wide index of devices and their available commands
+"""
+import asyncio
+import logging
+import os
+
+from network_server.executor import EXECUTOR
+
+SUFFIX = ".txt"
+TEMPLATE_SUFFIX = ".tmpl"
+# templates in this directory are served for every device
+FLEET = "_templates"
+
+
+def _list_commands(directory):
+    """ the commands in a directory, and those served from a template
+
+    A .txt file wins over a template for the same command.
+    """
+    files = []
+    templates = []
+    for entry in os.scandir(directory):
+        if not entry.is_file():
+            continue
+        if entry.name.endswith(SUFFIX):
+            files.append(entry.name[: -len(SUFFIX)])
+        elif entry.name.endswith(TEMPLATE_SUFFIX):
+            templates.append(entry.name[: -len(TEMPLATE_SUFFIX)])
+    templates = frozenset(templates).difference(files)
+    return tuple(files) + tuple(sorted(templates)), templates
+
+
+class DeviceCatalog:
+    """ device catalog
+
+    Built once from the device/commands directory, or from a packed
+    store, at startup and shared by every session. A periodic rescan
+    only lists the device directories whose mtime changed since the
+    previous scan, or reloads the store index when the store changed.
+
+    Templates in the _templates directory are served for every device,
+    including devices without a directory of their own.
+    """
+
+    def __init__(self):
+        self._directory = None
+        self._store = None
+        self._store_mtime = None
+        self._devices = {}
+        self._fleet = (None, (), frozenset())
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def load(self, directory, store=None):
+        """ scan every device directory below directory, or index the
+        store when one is provided
+        """
+        self._directory = directory
+        self._store = store
+        self._store_mtime = None
+        self._devices = {}
+        self._fleet = (None, (), frozenset())
+        self.rescan()
+        self._logger.info(
+            "Loaded %s devices from '%s'",
+            len(self._devices),
+            store.path if store else directory,
+        )
+
+    def rescan(self):
+        """ pick up new, changed and removed device directories
+
+        :return: the hostnames that changed
+        """
+        changed = self._rescan_fleet()
+        if self._store is not None:
+            return changed + self._rescan_store()
+        try:
+            entries = list(os.scandir(self._directory))
+        except FileNotFoundError:
+            entries = []
+        # work on a copy and swap it in, sessions keep reading the old one
+        devices = dict(self._devices)
+        seen = set()
+        for entry in entries:
+            if not entry.is_dir() or entry.name == FLEET:
+                continue
+            seen.add(entry.name)
+            mtime = entry.stat().st_mtime_ns
+            if self._scan_device(devices, entry.name, mtime):
+                changed.append(entry.name)
+        for hostname in set(devices) - seen:
+            del devices[hostname]
+            changed.append(hostname)
+        self._devices = devices
+        return changed
+
+    def _rescan_fleet(self):
+        fleet_dir = os.path.join(self._directory, FLEET)
+        try:
+            mtime = os.stat(fleet_dir).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._fleet[0]:
+            return []
+        if mtime is None:
+            self._fleet = (None, (), frozenset())
+        else:
+            self._fleet = (mtime,) + _list_commands(fleet_dir)
+        return [FLEET]
+
+    def _rescan_store(self):
+        mtime = os.stat(self._store.path).st_mtime_ns
+        if mtime == self._store_mtime:
+            return []
+        self._store_mtime = mtime
+        devices = {}
+        changed = []
+        for hostname, commands in self._store.index().items():
+            current = self._devices.get(hostname)
+            if current is not None and current[1] == commands:
+                devices[hostname] = current
+            else:
+                devices[hostname] = (mtime, commands, frozenset())
+                changed.append(hostname)
+        changed.extend(set(self._devices) - set(devices))
+        self._devices = devices
+        return changed
+
+    def _scan_device(self, devices, hostname, mtime):
+        current = devices.get(hostname)
+        if current is not None and current[0] == mtime:
+            return False
+        hostdir = os.path.join(self._directory, hostname)
+        devices[hostname] = (mtime,) + _list_commands(hostdir)
+        return True
+
+    def commands(self, hostname):
+        """ the commands available for a device
+
+        Devices added since the last rescan are scanned on first use.
+        """
+        device = self._devices.get(hostname)
+        if device is None and self._store is None:
+            hostdir = os.path.join(self._directory, hostname)
+            try:
+                self._scan_device(
+                    self._devices, hostname, os.stat(hostdir).st_mtime_ns
+                )
+                device = self._devices[hostname]
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+        if device is None:
+            return self._fleet[1]
+        return device[1] + tuple(
+            command for command in self._fleet[1] if command not in device[1]
+        )
+
+    def template(self, hostname, command):
+        """ the template file a command is rendered from, or None when
+        the command is served from a file or the store
+        """
+        device = self._devices.get(hostname)
+        if device is not None:
+            if command in device[2]:
+                return os.path.join(
+                    self._directory, hostname, command + TEMPLATE_SUFFIX
+                )
+            if command in device[1]:
+                return None
+        if command in self._fleet[2]:
+            return os.path.join(
+                self._directory, FLEET, command + TEMPLATE_SUFFIX
+            )
+        return None
+
+    def version(self, hostname):
+        """ changes whenever the commands for a device change
+        """
+        device = self._devices.get(hostname)
+        return (None if device is None else device[0], self._fleet[0])
+
+    def devices(self):
+        """ the known device hostnames
+        """
+        return list(self._devices)
+
+    async def watch(self, interval):
+        """ rescan the directory every interval seconds
+        """
+        while True:
+            await asyncio.sleep(interval)
+            changed = await EXECUTOR.run(
+                self.__class__.__name__, self.rescan
+            )
+            if changed:
+                self._logger.info("Rescanned devices: %s", ", ".join(changed))
+
+
+CATALOG = DeviceCatalog()
@@ -0,0 +1,233 @@
+""" A hierarchical model of a device's running-config and the per device
+overlays holding the changes made in configure mode
+"""
+from functools import lru_cache
+import re
+import threading
+
+RUNNING_CONFIG = "show running-config"
+
+# lines opening a section at the top level, entering one of these from
+# inside another section leaves that section first
+SECTIONS = re.compile(
+    r"^(interface|router|line|vlan|(?:ip )?vrf(?! forwarding)|ip access-list|"
+    r"ipv6 access-list|route-map|policy-map|class-map|controller|"
+    r"key chain|management|spanning-tree mst configuration)\b"
+)
+# lines opening a section nested in the current one
+SUBSECTIONS = re.compile(r"^(address-family|class)\b")
+# settings with a single value, a new value replaces the current one
+SINGLE_VALUED = re.compile(
+    r"^(hostname|description|ip address(?!.* secondary$)|mtu|speed|"
+    r"duplex|bandwidth|encapsulation|switchport mode|"
+    r"switchport access vlan|ip domain name|ip domain-name)\b"
+)
+
+
+class ConfigNode:
+    """ a config line and the lines indented below it
+    """
+
+    __slots__ = ("line", "raw", "children", "_index")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.line = raw.strip()
+        self.children = []
+        self._index = None
+
+    def child(self, line):
+        if self._index is None:
+            index = {}
+            for child in self.children:
+                index.setdefault(child.line, child)
+            self._index = index
+        return self._index.get(line)
+
+
+@lru_cache(maxsize=64)
+def parse(content):
+    """ parse indented config text, shared by every overlay on it
+
+    :return: the root node and the indentation of one level
+    """
+    root = ConfigNode("")
+    stack = [(-1, root)]
+    unit = None
+    for raw in content.splitlines():
+        indent = len(raw) - len(raw.lstrip(" "))
+        if not raw.strip():
+            indent = 0
+        elif indent and (unit is None or indent < unit):
+            unit = indent
+        while stack[-1][0] >= indent:
+            stack.pop()
+        node = ConfigNode(raw)
+        stack[-1][1].children.append(node)
+        stack.append((indent, node))
+    return root, unit or 1
+
+
+def _matches(line, prefix):
+    return line == prefix or line.startswith(prefix + " ")
+
+
+class ConfigOverlay:
+    """ the configuration changes made to a device
+
+    Only the changes are held, keyed by the path of section lines they
+    were made in, the base config is parsed once and shared. Rendering
+    walks the base config, leaving out removed lines and adding new ones
+    at the end of their section.
+    """
+
+    def __init__(self):
+        # section path -> lines added to the section, in order
+        self._added = {}
+        # section path -> base config lines removed from the section
+        self._removed = {}
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self._added or self._removed)
+
+    @staticmethod
+    def _base_node(root, path):
+        node = root
+        for line in path:
+            node = node.child(line)
+            if node is None:
+                return None
+        return node
+
+    def _is_section(self, root, path, line):
+        node = self._base_node(root, path + (line,))
+        return (node is not None and node.children) or (
+            path + (line,) in self._added
+        )
+
+    def _top_level(self, root, line):
+        """ whether line is a top level section, entered or removed from
+        the global config wherever it is typed
+        """
+        return SECTIONS.match(line) or self._is_section(root, (), line)
+
+    def apply(self, content, path, line):
+        """ apply a config line entered in section path
+
+        :param content: the base running-config
+        :return: the section path for the next line
+        """
+        root, _unit = parse(content)
+        with self._lock:
+            self.version += 1
+            if line.startswith("no "):
+                prefix = line[3:].strip()
+                if self._top_level(root, prefix):
+                    path = ()
+                self._remove(root, path, lambda other: _matches(other, prefix))
+                return path
+            if self._top_level(root, line):
+                path = ()
+            self._add(root, path, line)
+            if (
+                SECTIONS.match(line)
+                or SUBSECTIONS.match(line)
+                or self._is_section(root, path, line)
+            ):
+                return path + (line,)
+            return path
+
+    def _add(self, root, path, line):
+        single = SINGLE_VALUED.match(line)
+
+        def replaced(other):
+            # 'shutdown' replaces 'no shutdown', a new hostname the old one
+            if other == line:
+                return False
+            if other.startswith("no ") and _matches(line, other[3:]):
+                return True
+            return single is not None and _matches(other, single.group(0))
+
+        self._remove(root, path, replaced)
+        removed = self._removed.get(path)
+        if removed and line in removed:
+            removed.discard(line)
+            if not removed:
+                del self._removed[path]
+            return
+        node = self._base_node(root, path)
+        if node is not None and node.child(line) is not None:
+            return
+        added = self._added.setdefault(path, [])
+        if line not in added:
+            added.append(line)
+
+    def _remove(self, root, path, matches):
+        node = self._base_node(root, path)
+        gone = []
+        if node is not None:
+            for child in node.children:
+                if matches(child.line):
+                    self._removed.setdefault(path, set()).add(child.line)
+                    gone.append(child.line)
+        added = self._added.get(path)
+        if added:
+            gone.extend(line for line in added if matches(line))
+            added[:] = [line for line in added if not matches(line)]
+            if not added:
+                del self._added[path]
+        # drop the changes made inside removed sections
+        for line in gone:
+            section = path + (line,)
+            for changes in (self._added, self._removed):
+                for key in [
+                    key for key in changes if key[: len(section)] == section
+                ]:
+                    del changes[key]
+
+    def render(self, content):
+        """ the base running-config with the changes applied, normalized
+        the way ShowFileServer sends output
+        """
+        root, unit = parse(content)
+        output = []
+        with self._lock:
+            self._render(root, (), 0, unit, output)
+        output = "\n".join(output) + "\n"
+        return output if output.startswith("\n") else "\n" + output
+
+    def _render(self, node, path, depth, unit, output):
+        children = node.children if node is not None else []
+        removed = self._removed.get(path, ())
+        # IOS ends the config with 'end', keep it last
+        last = children[-1] if children and not path else None
+        if last is not None and last.line == "end":
+            children = children[:-1]
+        else:
+            last = None
+        for child in children:
+            if child.line in removed:
+                continue
+            output.append(child.raw)
+            section = path + (child.line,)
+            if child.children or section in self._added:
+                self._render(child, section, depth + 1, unit, output)
+        for line in self._added.get(path, ()):
+            output.append(" " * unit * depth + line)
+            self._render(None, path + (line,), depth + 1, unit, output)
+        if last is not None:
+            output.append(last.raw)
+
+
+OVERLAYS = {}
+
+
+def config_overlay(hostname):
+    """ the overlay for a device, shared by all of its sessions
+    """
+    overlay = OVERLAYS.get(hostname)
+    if overlay is None:
+        overlay = OVERLAYS[hostname] = ConfigOverlay()
+    return overlay
@@ -0,0 +1,111 @@
+""" A process wide, size bounded cache for command output
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+
+class ContentCache:
+    """ LRU cache of command output keyed by (hostname, command)
+
+    Entries are validated against the file's mtime and size on every
+    lookup so edited fixtures are served without a restart. Identical
+    content is held once, however many devices and commands share it,
+    and only counts once against the byte budget.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # content -> [the shared content object, reference count]
+        self._blobs = {}
+        self._size = 0
+        self._logical_size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, filename, loader):
+        """ return the cached content for key, loading it on a miss
+
+        :param key: the cache key, typically (hostname, command)
+        :param filename: the file backing the entry
+        :param loader: called with filename to produce the content
+        """
+        stat = os.stat(filename)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        return self.lookup(key, signature, lambda: loader(filename))
+
+    def lookup(self, key, signature, loader):
+        """ return the cached content for key if it was stored with the
+        same signature, otherwise call loader and cache the result
+
+        :param signature: anything comparable that changes with the
+            content's sources
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return self._put(key, signature, loader())
+
+    def _put(self, key, signature, content):
+        size = sys.getsizeof(content)
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return content
+            blob = self._blobs.get(content)
+            if blob is None:
+                blob = self._blobs[content] = [content, 0]
+                self._size += size
+            blob[1] += 1
+            self._entries[key] = (signature, blob[0])
+            self._logical_size += size
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+            return blob[0]
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        size = sys.getsizeof(entry[1])
+        self._logical_size -= size
+        blob = self._blobs[entry[1]]
+        blob[1] -= 1
+        if not blob[1]:
+            del self._blobs[entry[1]]
+            self._size -= size
+
+    def clear(self):
+        """ drop all entries and reset the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self._blobs.clear()
+            self._size = 0
+            self._logical_size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """ the cache counters, for sizing the byte budget
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "unique_entries": len(self._blobs),
+                "bytes": self._size,
+                "logical_bytes": self._logical_size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+CONTENT_CACHE = ContentCache()
@@ -0,0 +1,222 @@
+""" Compiled command dispatch
+"""
+from bisect import bisect_left
+import os
+import re
+from typing import Pattern
+
+INLINE_FLAGS = {re.IGNORECASE: "i", re.MULTILINE: "m", re.DOTALL: "s"}
+# backreferences and conditionals, which would refer to the wrong group
+# once the pattern is merged
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+# a leading inline flag group, e.g. '(?i)', which has to stay at the start
+# of the expression
+GLOBAL_FLAGS = re.compile(r"^\(\?[aiLmsux]+\)")
+# listed by '?' when the line is a complete command
+CR = "<cr>"
+
+
+class CommandTrie:
+    """ a token trie of the plain string commands
+
+    Each level keeps its tokens sorted so an abbreviated token is
+    resolved with a binary search, regardless of the number of commands.
+    """
+
+    def __init__(self):
+        self._root = {}
+        self._sorted = {}
+
+    def insert(self, command, value):
+        node = self._root
+        for token in command.split():
+            node = node.setdefault(token, {})
+        node[None] = (command, value)
+
+    def _children(self, node):
+        keys = self._sorted.get(id(node))
+        if keys is None:
+            keys = sorted(key for key in node if key is not None)
+            self._sorted[id(node)] = keys
+        return keys
+
+    def _step(self, node, token):
+        child = node.get(token)
+        if child is not None:
+            return child
+        keys = self._children(node)
+        idx = bisect_left(keys, token)
+        if idx == len(keys) or not keys[idx].startswith(token):
+            return None
+        if idx + 1 < len(keys) and keys[idx + 1].startswith(token):
+            return None
+        return node[keys[idx]]
+
+    def candidates(self, line):
+        """ the tokens that can follow line, or that complete its last
+        token when it does not end in a space
+
+        :return: the sorted tokens, with CR last when line is already a
+            complete command
+        """
+        tokens = line.split()
+        partial = "" if not line or line[-1].isspace() else tokens.pop()
+        node = self._root
+        for token in tokens:
+            node = self._step(node, token)
+            if node is None:
+                return []
+        keys = self._children(node)
+        matches = []
+        for key in keys[bisect_left(keys, partial) :]:
+            if not key.startswith(partial):
+                break
+            matches.append(key)
+        if not partial and None in node:
+            matches.append(CR)
+        return matches
+
+    def resolve(self, line):
+        """ resolve a possibly abbreviated line to (command, value)
+
+        :return: None when a token is unknown or ambiguous
+        """
+        node = self._root
+        for token in line.split():
+            node = self._step(node, token)
+            if node is None:
+                return None
+        return node.get(None)
+
+
+class CommandTable:
+    """ a plugin command table compiled for dispatch
+
+    Lines are matched exactly, then against all of the plugin regexes as
+    one alternation, then as IOS style abbreviations of the plain string
+    commands, e.g. 'sh run' for 'show running-config'.
+
+    Anything derived from the table, like the rendered help, can be kept
+    in cache, a new table is built whenever the commands change.
+    """
+
+    def __init__(self, commands, keystrokes=None, observers=()):
+        """
+        :param keystrokes: key to the plugin class handling it
+        :param observers: the plugin classes shown every line entered
+        """
+        self.commands = commands
+        self.keystrokes = keystrokes or {}
+        self.observers = tuple(observers)
+        self.cache = {}
+        self._exact = {}
+        self._trie = CommandTrie()
+        self._patterns = []
+        for key, value in commands.items():
+            if isinstance(key, Pattern):
+                self._patterns.append(value)
+            else:
+                self._exact[key] = value
+                self._trie.insert(key, value)
+        self._regex, self._fallback = self._compile(
+            [key for key in commands if isinstance(key, Pattern)]
+        )
+
+    @staticmethod
+    def _mergeable(pattern):
+        """ whether pattern keeps its meaning inside the alternation, its
+        flags must be expressible inline rather than set by a leading
+        '(?i)' style group, and its groups must not be referred to by
+        name or number
+        """
+        extra = pattern.flags & ~re.UNICODE
+        for flag in INLINE_FLAGS:
+            extra &= ~flag
+        return not (
+            extra
+            or pattern.groupindex
+            or BACKREFERENCE.search(pattern.pattern)
+            or GLOBAL_FLAGS.match(pattern.pattern)
+        )
+
+    @classmethod
+    def _compile(cls, patterns):
+        """ merge the patterns into one alternation, each match is told
+        apart by its group name
+
+        :return: the alternation or None, and a list of (index, pattern)
+            for the patterns that are matched one by one
+        """
+        alternatives = []
+        fallback = []
+        for idx, pattern in enumerate(patterns):
+            if not cls._mergeable(pattern):
+                fallback.append((idx, pattern))
+                continue
+            flags = "".join(
+                letter
+                for flag, letter in INLINE_FLAGS.items()
+                if pattern.flags & flag
+            )
+            source = pattern.pattern
+            if flags:
+                source = "(?{}:{})".format(flags, source)
+            alternative = "(?P<_{}>{})".format(idx, source)
+            try:
+                re.compile(alternative)
+            except re.error:
+                fallback.append((idx, pattern))
+                continue
+            alternatives.append(alternative)
+        if not alternatives:
+            return None, fallback
+        return re.compile("|".join(alternatives)), fallback
+
+    def candidates(self, line):
+        """ the tokens that can follow line, for '?'
+        """
+        return self._trie.candidates(line)
+
+    def complete(self, line):
+        """ complete the last token of line as far as it is unambiguous,
+        a unique token is completed with a trailing space
+
+        :return: the completed line or None if it can not be extended
+        """
+        if not line or line[-1].isspace():
+            return None
+        partial = line.split()[-1]
+        matches = [match for match in self.candidates(line) if match != CR]
+        if not matches:
+            return None
+        if len(matches) == 1:
+            return line[: -len(partial)] + matches[0] + " "
+        common = os.path.commonprefix(matches)
+        if len(common) > len(partial):
+            return line[: -len(partial)] + common
+        return None
+
+    def lookup(self, line):
+        """ find the command table entry for line
+
+        :return: (line, value) where line is expanded when abbreviated,
+            or None if there is no match
+        """
+        value = self._exact.get(line)
+        if value is not None:
+            return line, value
+        found = None
+        if self._regex is not None:
+            match = self._regex.match(line)
+            if match:
+                found = int(match.lastgroup[1:])
+        # the first matching pattern wins, as it would unmerged
+        for idx, pattern in self._fallback:
+            if found is not None and idx > found:
+                break
+            if pattern.match(line):
+                found = idx
+                break
+        if found is not None:
+            return line, self._patterns[found]
+        return self._trie.resolve(line)
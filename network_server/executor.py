@@ -0,0 +1,119 @@
+""" A process wide thread pool for blocking file and subprocess work
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from network_server.metrics import METRICS
+
+
+class ExecutorService:
+    """ one bounded thread pool shared by the plugins
+
+    At most max_workers calls run at once and at most max_queue more
+    wait in the pool's queue, further callers wait on the event loop
+    until there is room. Time spent waiting and running is recorded per
+    caller. The pool is created on first use, so each worker process
+    gets its own.
+    """
+
+    def __init__(self, max_workers=16, max_queue=256):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._slots = None
+        self.active = 0
+        self.queued = 0
+        self.waiting = 0
+
+    def configure(self, max_workers, max_queue):
+        self.shutdown()
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+
+    def _start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="mock-io"
+        )
+        self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+
+    async def run(self, owner, func, *args):
+        """ run func(*args) in the pool
+
+        :param owner: the name usage is recorded under, e.g. the plugin
+        """
+        if self._executor is None:
+            self._start()
+        submitted = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.queued += 1
+        started = []
+
+        def call():
+            started.append(time.perf_counter())
+            self.queued -= 1
+            self.active += 1
+            try:
+                return func(*args)
+            finally:
+                self.active -= 1
+
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                self._executor, call
+            )
+        finally:
+            self._slots.release()
+            end = time.perf_counter()
+            if started:
+                METRICS.observe(
+                    "mock_executor_wait_seconds",
+                    started[0] - submitted,
+                    owner=owner,
+                )
+                METRICS.observe(
+                    "mock_executor_run_seconds", end - started[0], owner=owner
+                )
+            else:
+                self.queued -= 1
+
+    def stats(self):
+        return {
+            "threads": self.max_workers,
+            "active": self.active,
+            "queued": self.queued,
+            "waiting": self.waiting,
+        }
+
+    def shutdown(self, wait=True):
+        """ finish the running calls and stop the threads, queued calls
+        are cancelled
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+        self._slots = None
+        self.active = self.queued = self.waiting = 0
+
+    def _after_fork(self):
+        # the pool's threads do not survive a fork
+        self._executor = None
+        self._slots = None
+        self.active = self.queued = self.waiting = 0
+
+
+EXECUTOR = ExecutorService()
+os.register_at_fork(
+    after_in_child=EXECUTOR._after_fork  # pylint: disable=W0212
+)
+METRICS.add_collector(
+    lambda: {
+        "mock_executor_{}".format(key): value
+        for key, value in EXECUTOR.stats().items()
+    }
+)
@@ -0,0 +1,130 @@
+""" IOS style output filters, e.g. 'show running-config | include vlan'
+"""
+from functools import lru_cache
+import re
+
+FILTERS = ("begin", "count", "exclude", "include", "section")
+
+
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern):
+    """ the compiled filter regex, shared by every session
+    """
+    return re.compile(pattern)
+
+
+def split_pipe(line):
+    """ split a trailing filter off a line
+
+    The filter name may be abbreviated, 'sh run | i host'.
+
+    :return: (the base command, a LineFilter) or None if the line does
+        not end in a known filter
+    """
+    base, sep, spec = line.rpartition(" | ")
+    if not sep or not base.strip():
+        return None
+    name, _, pattern = spec.strip().partition(" ")
+    candidates = [
+        candidate for candidate in FILTERS if candidate.startswith(name)
+    ]
+    if not name or len(candidates) != 1:
+        return None
+    pattern = pattern.strip()
+    if not pattern and candidates[0] != "count":
+        return None
+    try:
+        regex = compile_pattern(pattern)
+    except re.error:
+        return None
+    return base.strip(), LineFilter(candidates[0], regex)
+
+
+class LineFilter:
+    """ filter output line by line as it is written
+
+    Output is fed a chunk at a time, a line split across chunks is held
+    until the rest of it arrives.
+    """
+
+    def __init__(self, name, regex):
+        self.name = name
+        self._regex = regex
+        self._partial = ""
+        self._started = False
+        self._section = None
+        self._count = 0
+
+    def _keep(self, line):
+        matched = self._regex.search(line) is not None
+        if self.name == "include":
+            return matched
+        if self.name == "exclude":
+            return not matched
+        if self.name == "begin":
+            self._started = self._started or matched
+            return self._started
+        if self.name == "section":
+            indent = len(line) - len(line.lstrip())
+            if self._section is not None and line.strip():
+                if indent > self._section:
+                    return True
+                self._section = None
+            if matched:
+                self._section = indent
+            return matched
+        self._count += matched
+        return False
+
+    def feed(self, chunk):
+        """ the filtered complete lines of chunk
+        """
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        return "".join(line + "\n" for line in lines if self._keep(line))
+
+    def close(self):
+        """ the filtered output still held back
+        """
+        output = ""
+        if self._partial and self._keep(self._partial):
+            output = self._partial + "\n"
+        self._partial = ""
+        if self.name == "count":
+            output += "Number of lines which match regexp = {}\n".format(
+                self._count
+            )
+        return output
+
+    def apply(self, output):
+        """ filter a string, or an async iterator of strings
+
+        :return: the same kind of output, filtered
+        """
+        if isinstance(output, str):
+            if output.startswith("\n"):
+                output = output[1:]
+            return "\n" + self.feed(output) + self.close()
+        return self._stream(output)
+
+    async def _stream(self, output):
+        yield "\n"
+        first = True
+        try:
+            async for chunk in output:
+                if first and chunk:
+                    # the output's own leading newline was sent above
+                    if chunk.startswith("\n"):
+                        chunk = chunk[1:]
+                    first = False
+                filtered = self.feed(chunk)
+                if filtered:
+                    yield filtered
+            remainder = self.close()
+            if remainder:
+                yield remainder
+        finally:
+            # plain async iterators have nothing to close
+            close = getattr(output, "aclose", None)
+            if close is not None:
+                await close()
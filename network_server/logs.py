@@ -0,0 +1,179 @@
+""" Logging setup, optionally handing records to a background thread
+"""
+import atexit
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+import time
+
+from network_server.metrics import METRICS
+
+
+class JsonFormatter(logging.Formatter):
+    """ one json object per record
+    """
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class SamplingFilter(logging.Filter):
+    """ keep one in every N records for the configured loggers
+
+    :param rates: logger name to the fraction of records kept, a logger's
+        children use its rate unless they have their own
+    """
+
+    def __init__(self, rates):
+        super(SamplingFilter, self).__init__()
+        self._every = {
+            name: max(1, int(round(1 / rate))) if rate else 0
+            for name, rate in rates.items()
+        }
+        self._seen = {}
+        self._resolved = {}
+        self.dropped = 0
+
+    def _interval(self, name):
+        every = self._resolved.get(name)
+        if every is None:
+            every = 1
+            parts = name.split(".")
+            for idx in range(len(parts), 0, -1):
+                parent = ".".join(parts[:idx])
+                if parent in self._every:
+                    every = self._every[parent]
+                    break
+            self._resolved[name] = every
+        return every
+
+    def filter(self, record):
+        every = self._interval(record.name)
+        if every == 1:
+            return True
+        if not every:
+            self.dropped += 1
+            return False
+        seen = self._seen.get(record.name, 0)
+        self._seen[record.name] = seen + 1
+        if seen % every:
+            self.dropped += 1
+            return False
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """ a token bucket per logger allowing rate records per second
+    """
+
+    def __init__(self, rate):
+        super(RateLimitFilter, self).__init__()
+        self._rate = rate
+        # a bucket under one token would drop every record
+        self._burst = max(1, rate)
+        self._buckets = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        now = time.monotonic()
+        tokens, last = self._buckets.get(record.name, (self._burst, now))
+        tokens = min(self._burst, tokens + (now - last) * self._rate)
+        if tokens < 1:
+            self._buckets[record.name] = (tokens, now)
+            self.dropped += 1
+            return False
+        self._buckets[record.name] = (tokens - 1, now)
+        return True
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """ hand records to the listener thread unformatted, dropping them
+    when the queue is full rather than blocking the event loop
+    """
+
+    def __init__(self, maxsize):
+        super(BackgroundQueueHandler, self).__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def prepare(self, record):
+        # formatting happens in the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(
+    level="DEBUG",
+    log_format="text",
+    background=False,
+    queue_size=10000,
+    sample=None,
+    rate_limit=None,
+):
+    """ configure the root logger
+
+    :param background: format and write records in a background thread
+    :param sample: logger name to the fraction of its records kept
+    :param rate_limit: the most records per second per logger
+    """
+    handler = logging.StreamHandler()
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    filters = []
+    if sample:
+        filters.append(SamplingFilter(sample))
+    if rate_limit:
+        filters.append(RateLimitFilter(rate_limit))
+    root = logging.getLogger()
+    root.setLevel(level)
+    if not background:
+        for log_filter in filters:
+            handler.addFilter(log_filter)
+        root.addHandler(handler)
+        METRICS.add_collector(
+            lambda: {
+                "mock_log_dropped": sum(f.dropped for f in filters),
+            }
+        )
+        return
+    queue_handler = BackgroundQueueHandler(queue_size)
+    for log_filter in filters:
+        queue_handler.addFilter(log_filter)
+    root.addHandler(queue_handler)
+    listener = QueueListener(queue_handler.queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    def restart_in_child():
+        # the listener thread does not survive a fork, give each worker
+        # its own queue and thread
+        queue_handler.queue = queue.Queue(queue_handler.maxsize)
+        listener.queue = queue_handler.queue
+        listener._thread = None  # pylint: disable=W0212
+        listener.start()
+
+    os.register_at_fork(after_in_child=restart_in_child)
+    METRICS.add_collector(
+        lambda: {
+            "mock_log_dropped": queue_handler.dropped
+            + sum(f.dropped for f in filters),
+            "mock_log_queued": queue_handler.queue.qsize(),
+        }
+    )
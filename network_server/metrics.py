@@ -0,0 +1,183 @@
+""" Process wide counters, gauges and latency histograms
+"""
+import asyncio
+from bisect import bisect_left
+import logging
+
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    """ a fixed bucket latency histogram, observing is a bisect and two
+    additions
+    """
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, quantile):
+        """ the upper bound of the bucket holding the quantile
+        """
+        target = quantile * self.count
+        cumulative = 0
+        for idx, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target and count:
+                return BUCKETS[idx] if idx < len(BUCKETS) else float("inf")
+        return 0.0
+
+
+class Metrics:
+    """ the metrics registry
+
+    Metrics are keyed by name and a tuple of label pairs. Values that
+    are owned elsewhere, like the cache counters, are read from the
+    collectors when the metrics are rendered.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(labels.items()))
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name, amount, **labels):
+        """ add amount, which may be negative, to a gauge
+        """
+        key = (name, tuple(labels.items()))
+        self._gauges[key] = self._gauges.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def add_collector(self, collector):
+        """ collector returns a dict of gauge name to value
+        """
+        self._collectors.append(collector)
+
+    def counters(self):
+        return dict(self._counters)
+
+    def gauges(self):
+        gauges = dict(self._gauges)
+        for collector in self._collectors:
+            for name, value in collector().items():
+                gauges[(name, ())] = value
+        return gauges
+
+    def histograms(self, name):
+        return {
+            labels: histogram
+            for (hname, labels), histogram in self._histograms.items()
+            if hname == name
+        }
+
+    def render(self):
+        """ the metrics in the prometheus text exposition format
+        """
+        lines = []
+        for (name, labels), value in sorted(self.counters().items()):
+            lines.append("{}{} {}".format(name, _labels(labels), value))
+        for (name, labels), value in sorted(self.gauges().items()):
+            lines.append("{}{} {}".format(name, _labels(labels), value))
+        for (name, labels), histogram in sorted(
+            self._histograms.items(), key=lambda item: item[0]
+        ):
+            cumulative = 0
+            for idx, count in enumerate(histogram.counts):
+                cumulative += count
+                bound = str(BUCKETS[idx]) if idx < len(BUCKETS) else "+Inf"
+                lines.append(
+                    "{}_bucket{} {}".format(
+                        name, _labels(labels + (("le", bound),)), cumulative
+                    )
+                )
+            lines.append(
+                "{}_sum{} {}".format(name, _labels(labels), histogram.total)
+            )
+            lines.append(
+                "{}_count{} {}".format(name, _labels(labels), histogram.count)
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '{}="{}"'.format(
+                key,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for key, value in labels
+        )
+        + "}"
+    )
+
+
+async def serve_metrics(port, host="127.0.0.1"):
+    """ serve the metrics over http on port
+    """
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = METRICS.render().encode("utf-8")
+            writer.write(
+                b"HTTP/1.0 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n"
+            )
+            writer.write(body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    await asyncio.start_server(handle, host, port)
+    logging.getLogger("Metrics").info(
+        "Serving metrics on http://%s:%s/metrics", host, port
+    )
+
+
+METRICS = Metrics()
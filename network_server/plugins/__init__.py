@@ -1,6 +1,9 @@
 """ the plugin base class
 """
 import logging
+import sys
+
+from network_server.executor import EXECUTOR
 
 
 class PluginBase:
@@ -15,25 +18,57 @@ class PluginBase:
         self._directory = kwargs["directory"]
         self._hostname = kwargs["hostname"]
         self.username = kwargs["username"]
+        # the device's CommandTable, None while the table is being built
+        self._table = kwargs.get("table")
         self._logger = logging.getLogger(self.__class__.__name__)
-        logging.basicConfig(level=logging.INFO)
 
     def commands(self):
         return []
 
     def keystrokes(self):
+        """ the keys handled by execute_keystroke, e.g. '?'
+        """
         return []
 
     def execute_command(self, line):
         return "\r\n", True
 
-    def execute_keystroke(self, char, line_buffer):
-        return "", False
+    def execute_keystroke(self, key, line, pos):
+        """ handle a key pressed while a line is being typed
+
+        :param line: the input line so far
+        :param pos: the cursor position in line
+        :return: (output, line, pos), the output is followed by the
+            prompt and the input line is replaced, or None to ring the
+            bell
+        """
+        return None
+
+    def observe_command(self, line):
+        """ called with every line entered in the session when the
+        plugin overrides it
+        """
+
+    def footprint(self):
+        """ the bytes held by the plugin instance for its session
+        """
+        return sys.getsizeof(self) + sys.getsizeof(vars(self))
+
+    async def run_blocking(self, func, *args):
+        """ run blocking file or subprocess work in the shared executor,
+        accounted to the plugin
+        """
+        return await EXECUTOR.run(self.__class__.__name__, func, *args)
 
     def send_status(self, status):
         self._process.stdout.write(status)
 
     def respond(self, output="", prompt=True, context=False, new_prompt=False):
+        """ build the response for the session
+
+        :param output: a string, or an async iterator of strings for large
+            output, which is written in chunks as the client consumes it
+        """
         return {
             "output": output,
             "prompt": prompt,
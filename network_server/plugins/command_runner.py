@@ -1,14 +1,23 @@
 """ cmdrunner
 """
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import os
 import re
+import threading
+import time
 import uuid
 
-import ansible_runner
+import asyncssh
+from network_server.executor import EXECUTOR
 from network_server.plugins import PluginBase
 
+try:
+    import ansible_runner
+except ImportError:
+    ansible_runner = None
+
 CHECK = "\u2714"  # heavy checkmark
 XMARK = "\u2716"  # heavy multiplication
 MINUS = "\u2796"  # heavy minus
@@ -21,6 +30,9 @@ class CommandRunner(PluginBase):
         super(CommandRunner, self).__init__(*args, **kwargs)
         self._in_context = False
         self._meta = {}
+        self._manifests = {}
+        self._manifest_lock = threading.Lock()
+        self._outcomes = {}
 
     def commands(self):
         return ["cmdrunner", "help cmdrunner"]
@@ -94,28 +106,119 @@ class CommandRunner(PluginBase):
             ]
         else:
             commands = self._default_commands()
-        acr = AnsibleCommandsRunner(
+        engine = self._meta.get("engine", "ansible")
+        if engine not in ["ansible", "native"]:
+            self.send_status(
+                "The engine must be either 'ansible' or 'native'\n"
+            )
+            return
+        if engine == "ansible" and ansible_runner is None:
+            self.send_status(
+                "ansible_runner is not installed, 'pip install ansible_runner'"
+                " or 'set engine=native'\n"
+            )
+            return
+        self._manifests = {}
+        self._outcomes = {"new": 0, "changed": 0, "unchanged": 0}
+        groups, fresh = await self._stale_groups(commands)
+        self.send_status("Running...\n")
+        counts = {"ok": 0, "failed": 0}
+        for group_commands, hosts in groups.items():
+            acr = self._runner(engine, list(group_commands), hosts)
+            group_counts = await acr.run()
+            for key in counts:
+                counts[key] += group_counts[key]
+        self.send_status(
+            "Collected {ok} outputs: {new} new, {changed} changed,"
+            " {unchanged} unchanged, {failed} failed, {fresh} fresh"
+            " and skipped\n".format(fresh=fresh, **counts, **self._outcomes)
+        )
+        return
+
+    def _runner(self, engine, commands, hosts):
+        if engine == "native":
+            return NativeCommandsRunner(
+                commands=commands,
+                hosts=hosts,
+                inventory=self._inventory(),
+                event_handler=self._event_handler,
+                result_handler=self._save_result,
+                concurrency=int(self._meta.get("concurrency", 50)),
+                timeout=float(self._meta.get("timeout", 60)),
+                port=int(self._meta.get("port", 22)),
+            )
+        return AnsibleCommandsRunner(
             commands=commands,
-            hosts=list(self._hosts().keys()),
+            hosts=hosts,
             inventory=self._inventory(),
             event_handler=self._event_handler,
+            result_handler=self._save_result,
         )
-        self.send_status("Running...\n")
-        results = await acr.run()
-
-        for host, commands in results.items():
-            directory = "{}/{}".format(self._directory, host)
-            if not os.path.exists(directory):
-                os.makedirs(directory)
-            for command, result in commands.items():
-                filename = "{}/{}.txt".format(directory, command)
-                with open(filename, "w") as out_file:
-                    out_file.write(result["stdout"])
-                    self.send_status(
-                        "[{}] [{}] wrote '{}'\n".format(CHECK, host, filename)
-                    )
 
-        return
+    async def _stale_groups(self, commands):
+        """ group the hosts by the commands they need collected
+
+        Without 'set max_age=' every host collects every command.
+
+        :return: the hosts keyed by a tuple of commands and the number of
+            outputs skipped because they are fresh
+        """
+        hosts = list(self._hosts().keys())
+        if "max_age" not in self._meta:
+            return {tuple(commands): hosts}, 0
+        max_age = float(self._meta["max_age"])
+        groups = {}
+        fresh = 0
+        for host in hosts:
+            manifest = await self.run_blocking(self._manifest, host)
+            stale = tuple(manifest.stale(commands, max_age, time.time()))
+            fresh += len(commands) - len(stale)
+            if stale:
+                groups.setdefault(stale, []).append(host)
+        return groups, fresh
+
+    def _manifest(self, host):
+        with self._manifest_lock:
+            if host not in self._manifests:
+                self._manifests[host] = Manifest(
+                    "{}/{}".format(self._directory, host)
+                )
+            return self._manifests[host]
+
+    async def _save_result(self, host, command, stdout):
+        """ write a result as soon as it arrives, off the event loop
+        """
+        filename, outcome = await self.run_blocking(
+            self._write_result, host, command, stdout
+        )
+        self._outcomes[outcome] += 1
+        if outcome == "unchanged":
+            self.send_status(
+                "[{}] [{}] unchanged '{}'\n".format(MINUS, host, filename)
+            )
+        else:
+            self.send_status(
+                "[{}] [{}] wrote '{}'\n".format(CHECK, host, filename)
+            )
+
+    def _write_result(self, host, command, stdout):
+        """ write the output unless it is unchanged, and record its hash
+        and collection time in the device manifest
+        """
+        stdout = stdout or ""
+        directory = "{}/{}".format(self._directory, host)
+        os.makedirs(directory, exist_ok=True)
+        filename = "{}/{}.txt".format(directory, command)
+        manifest = self._manifest(host)
+        # results for a host may be saved from several threads at once
+        with manifest.lock:
+            outcome = manifest.update(command, filename, stdout, time.time())
+            if outcome != "unchanged":
+                with open(filename, "w") as out_file:
+                    out_file.write(stdout)
+            manifest.written(command, filename)
+            manifest.save()
+        return filename, outcome
 
     @staticmethod
     def _help():
@@ -157,6 +260,35 @@ class CommandRunner(PluginBase):
                 "set username=xxxx", "Set the username. (default=current user)"
             )
         )
+        output.append(
+            "{:<40}{:<50}".format(
+                "set max_age=3600",
+                "Only collect outputs older than this. (default=all)",
+            )
+        )
+        output.append(
+            "{:<40}{:<50}".format(
+                "set engine=native",
+                "Collect with ansible or asyncssh. (default=ansible)",
+            )
+        )
+        output.append(
+            "{:<40}{:<50}".format(
+                "set concurrency=50",
+                "Devices collected at once, native only. (default=50)",
+            )
+        )
+        output.append(
+            "{:<40}{:<50}".format(
+                "set timeout=60",
+                "Seconds allowed per device, native only. (default=60)",
+            )
+        )
+        output.append(
+            "{:<40}{:<50}".format(
+                "set port=22", "The SSH port, native only. (default=22)",
+            )
+        )
         output.append(
             "{:<40}{:<50}".format(
                 "run",
@@ -214,47 +346,143 @@ class CommandRunner(PluginBase):
         return self.respond(context=self)
 
 
+class Manifest:
+    """ the content hash and collection time of each of a device's
+    outputs, kept next to the outputs in .manifest.json
+    """
+
+    FILENAME = ".manifest.json"
+
+    def __init__(self, directory):
+        self._path = os.path.join(directory, self.FILENAME)
+        # held across update and save
+        self.lock = threading.Lock()
+        try:
+            with open(self._path) as fhand:
+                self._entries = json.load(fhand)
+        except (FileNotFoundError, ValueError):
+            self._entries = {}
+
+    def stale(self, commands, max_age, now):
+        """ the commands never collected or collected over max_age ago
+        """
+        return [
+            command
+            for command in commands
+            if now - self._entries.get(command, {}).get("collected", 0)
+            > max_age
+        ]
+
+    @staticmethod
+    def _digest(content):
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _stat(filename):
+        stat = os.stat(filename)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def update(self, command, filename, content, now):
+        """ record a collected output
+
+        The recorded hash stands in for the file while the file's mtime
+        and size are those recorded with it, a file edited since is
+        hashed again.
+
+        :return: 'new', 'changed' or 'unchanged' compared to the file
+        """
+        digest = self._digest(content)
+        entry = self._entries.get(command, {})
+        if not os.path.exists(filename):
+            outcome = "new"
+        else:
+            previous = entry.get("sha256")
+            if previous is None or entry.get("stat") != self._stat(filename):
+                # edited, or written before there was a manifest
+                with open(filename) as fhand:
+                    previous = self._digest(fhand.read())
+            outcome = "unchanged" if previous == digest else "changed"
+        self._entries[command] = {"sha256": digest, "collected": now}
+        return outcome
+
+    def written(self, command, filename):
+        """ record the mtime and size of the file holding an output
+        """
+        self._entries[command]["stat"] = self._stat(filename)
+
+    def save(self):
+        tmp_path = "{}.tmp".format(self._path)
+        with open(tmp_path, "w") as fhand:
+            json.dump(self._entries, fhand, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._path)
+
+
 class AnsibleCommandsRunner:  # pylint: disable=R0903
     """ run commands using runner and cli_command
+
+    Events arrive on the runner's thread, they are handed to the event
+    loop as they arrive and results are saved right away rather than
+    kept until the playbook finishes.
     """
 
     DESIRED_EVENTS = ["runner_on_ok", "runner_on_failed", "runner_on_skipped"]
 
-    def __init__(self, commands, hosts, inventory, event_handler):
+    def __init__(
+        self, commands, hosts, inventory, event_handler, result_handler
+    ):  # pylint: disable=R0913
         self._commands = commands
         self._hosts = hosts
         self._inventory = inventory
         self._event_handler = event_handler
-        self._events = []
-        self._tasks = []
+        self._result_handler = result_handler
+        self._task_commands = {}
+        self._pending = []
+        self._counts = {"ok": 0, "failed": 0}
+        self._loop = None
 
     def _interesting_event(self, event):
-        if event["event"] in self.DESIRED_EVENTS:
-            task_name = event.get("event_data", {}).get("task")
-            event["command"] = next(
-                task["cli_command"]["command"]
-                for task in self._tasks
-                if task["name"] == task_name
-            )
-            self._event_handler(event)
+        if event["event"] not in self.DESIRED_EVENTS:
+            return
+        event_data = event.get("event_data", {})
+        event["command"] = self._task_commands.get(event_data.get("task"))
+        self._loop.call_soon_threadsafe(self._event_handler, event)
         if event["event"] == "runner_on_ok":
-            self._events.append(event)
+            self._counts["ok"] += 1
+            self._pending = [
+                future for future in self._pending if not future.done()
+            ]
+            self._pending.append(
+                asyncio.run_coroutine_threadsafe(
+                    self._result_handler(
+                        event_data["host"],
+                        event["command"],
+                        event_data["res"].get("stdout"),
+                    ),
+                    self._loop,
+                )
+            )
+        elif event["event"] == "runner_on_failed":
+            self._counts["failed"] += 1
 
     async def run(self):
         """ run
+
+        :return: the number of ok and failed results
         """
-        self._tasks = [
+        tasks = [
             {"name": str(uuid.uuid1()), "cli_command": {"command": command}}
             for command in self._commands
         ]
+        self._task_commands = {
+            task["name"]: task["cli_command"]["command"] for task in tasks
+        }
         playbook = [
-            {"hosts": self._hosts, "gather_facts": False, "tasks": self._tasks}
+            {"hosts": self._hosts, "gather_facts": False, "tasks": tasks}
         ]
-        executor = ThreadPoolExecutor(max_workers=1)
-        loop = asyncio.get_event_loop()
+        self._loop = asyncio.get_event_loop()
 
-        await loop.run_in_executor(
-            executor,
+        await EXECUTOR.run(
+            "CommandRunner",
             lambda: ansible_runner.run(
                 playbook=playbook,
                 inventory=self._inventory,
@@ -263,23 +491,155 @@ class AnsibleCommandsRunner:  # pylint: disable=R0903
                 event_handler=self._interesting_event,
             ),
         )
-        results_by_host = {}
-
-        for host in self._hosts:
-            results_by_host[host] = {}
-            for task in playbook[0]["tasks"]:
-                res = [
-                    {
-                        "event": event["event"],
-                        "stdout": event["event_data"]["res"].get("stdout"),
-                        "message": event["event_data"]["res"].get("msg"),
-                    }
-                    for event in self._events
-                    if event.get("event_data", {}).get("task") == task["name"]
-                    and event["event_data"]["host"] == host
-                ]
-                if res:
-                    results_by_host[host][
-                        task["cli_command"]["command"]
-                    ] = res[0]
-        return results_by_host
+        await asyncio.gather(
+            *[asyncio.wrap_future(future) for future in self._pending]
+        )
+        return self._counts
+
+
+class NativeCommandsRunner:  # pylint: disable=R0903
+    """ run commands over asyncssh, many devices at once
+
+    Events have the same shape as AnsibleCommandsRunner's and results
+    are saved as each command completes.
+    """
+
+    # e.g. 'router#', 'switch(config)#', 'host>' or 'vyos@vyos:~$'
+    PROMPT = re.compile(r"[\w+\-\.:/\[\]@~]+(?:\([^\)]+\)){0,3}[>#$] ?$")
+    PASSWORD_PROMPT = re.compile(r"[Pp]assword: ?$")
+    # the most output searched for a prompt
+    TAIL = 256
+    TERMINAL_COMMANDS = {
+        "eos": ["terminal length 0", "terminal width 512"],
+        "ios": ["terminal length 0", "terminal width 512"],
+        "nxos": ["terminal length 0", "terminal width 511"],
+        "vyos": ["set terminal length 0", "set terminal width 512"],
+    }
+
+    def __init__(
+        self,
+        commands,
+        hosts,
+        inventory,
+        event_handler,
+        result_handler,
+        concurrency=50,
+        timeout=60,
+        port=22,
+    ):  # pylint: disable=R0913
+        self._commands = commands
+        self._hosts = hosts
+        self._vars = inventory["all"]["vars"]
+        self._event_handler = event_handler
+        self._result_handler = result_handler
+        self._counts = {"ok": 0, "failed": 0}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._timeout = timeout
+        self._port = port
+
+    def _event(self, host, command, status, stdout=None, msg=None):
+        self._counts[status] += 1
+        event = {
+            "event": "runner_on_{}".format(status),
+            "command": command,
+            "event_data": {
+                "host": host,
+                "res": {"stdout": stdout, "msg": msg},
+            },
+        }
+        self._event_handler(event)
+
+    async def _read_until(self, process, *patterns):
+        """ read until the last line of the output matches a pattern
+
+        Only the last line is searched, the chunks read are joined once.
+        """
+        chunks = []
+        tail = ""
+        while not any(
+            pattern.search(self._last_line(tail)) for pattern in patterns
+        ):
+            chunk = await process.stdout.read(65536)
+            if not chunk:
+                raise ConnectionError("Connection closed by the device")
+            chunks.append(chunk)
+            tail = (tail + chunk[-self.TAIL :])[-self.TAIL :]
+        return "".join(chunks)
+
+    @staticmethod
+    def _last_line(output):
+        return output.rpartition("\n")[2].rpartition("\r")[2]
+
+    def _device_prompt(self, output):
+        """ a pattern matching only the prompt output ends with, so output
+        lines ending in '#' or '>' are not taken for the prompt
+        """
+        prompt = self._last_line(output).rstrip()
+        return re.compile(r"^{} ?$".format(re.escape(prompt)))
+
+    async def _send(self, process, command, prompt=None):
+        """
+        :param prompt: the device prompt, the generic PROMPT if not known
+        """
+        process.stdin.write(command + "\n")
+        output = await self._read_until(process, prompt or self.PROMPT)
+        lines = output.replace("\r", "").split("\n")
+        # drop the echoed command and the trailing prompt
+        return "\n".join(lines[1:-1]).strip()
+
+    async def _collect(self, host, remaining):
+        async with asyncssh.connect(
+            host,
+            self._port,
+            username=self._vars["ansible_user"],
+            password=self._vars["ansible_password"],
+            known_hosts=None,
+        ) as conn:
+            process = await conn.create_process(
+                term_type="vt100", term_size=(511, 24)
+            )
+            output = await self._read_until(process, self.PROMPT)
+            if output.rstrip().endswith(">") and self._vars["ansible_become"]:
+                process.stdin.write("enable\n")
+                output = await self._read_until(
+                    process, self.PASSWORD_PROMPT, self.PROMPT
+                )
+                if self.PASSWORD_PROMPT.search(self._last_line(output)):
+                    process.stdin.write(
+                        self._vars["ansible_become_pass"] + "\n"
+                    )
+                    output = await self._read_until(process, self.PROMPT)
+            prompt = self._device_prompt(output)
+            network_os = self._vars["ansible_network_os"]
+            for command in self.TERMINAL_COMMANDS.get(network_os, []):
+                await self._send(process, command, prompt)
+            for command in self._commands:
+                stdout = await self._send(process, command, prompt)
+                self._event(host, command, "ok", stdout)
+                remaining.remove(command)
+                await self._result_handler(host, command, stdout)
+            process.stdin.write("exit\n")
+
+    async def _run_host(self, host):
+        remaining = list(self._commands)
+        async with self._semaphore:
+            try:
+                await asyncio.wait_for(
+                    self._collect(host, remaining), self._timeout
+                )
+                return
+            except asyncio.TimeoutError:
+                msg = "timed out after {}s".format(self._timeout)
+            except (OSError, asyncssh.Error) as exc:
+                msg = str(exc)
+            # the commands collected before the failure are already saved
+            for command in remaining:
+                self._event(host, command, "failed", msg=msg)
+
+    async def run(self):
+        """ run
+
+        :return: the number of ok and failed results
+        """
+        await asyncio.gather(*[self._run_host(host) for host in self._hosts])
+        return self._counts
@@ -2,21 +2,34 @@
 """
 import logging
 import re
+from network_server.config_tree import RUNNING_CONFIG, config_overlay
 from network_server.plugins import PluginBase
+from network_server.plugins.show_file_server import ShowFileServer
+
+# the prompt suffix of a section, by its first word
+SUBMODES = {"interface": "if", "address-family": "router-af"}
 
 
 class Configure(PluginBase):
     """ configuration mode
+
+    Config lines are applied to the device's config overlay, so they
+    show up in 'show running-config' for every session of the device.
     """
 
     def __init__(self, *args, **kwargs):
         super(Configure, self).__init__(*args, **kwargs)
         self._in_context = False
+        # the section lines the session is in, e.g. ('interface Gi1',)
+        self._path = ()
+        # reads the base running-config, created on first use
+        self._show = None
 
     def commands(self):
         return [re.compile("conf.*")]
 
     async def execute_command(self, line):
+        line = line.strip()
         if not self._in_context:
             self._logger.info(
                 "%s: User entered configure mode  with '%s'",
@@ -24,7 +37,8 @@ class Configure(PluginBase):
                 line,
             )
             self._in_context = True
-        elif line in ["exit", "end"]:
+            self._path = ()
+        elif line == "end" or (line == "exit" and not self._path):
             self._in_context = False
             self._logger.info(
                 "%s: User exited configure mode.", self._hostname
@@ -32,9 +46,32 @@ class Configure(PluginBase):
             return self.respond(
                 context=False, new_prompt="{}#".format(self._hostname)
             )
-        else:
+        elif line == "exit":
+            self._path = self._path[:-1]
+        elif line and not line.startswith("!"):
             self._logger.info("%s:%s", self._hostname, line)
+            await self._apply(line)
+
+        return self.respond(context=self, new_prompt=self._prompt())
+
+    async def _apply(self, line):
+        if self._show is None:
+            self._show = ShowFileServer(
+                commands=self._commands,
+                directory=self._directory,
+                hostname=self._hostname,
+                process=None,
+                username=self.username,
+            )
+        base = await self._show.read(RUNNING_CONFIG)
+        self._path = config_overlay(self._hostname).apply(
+            base or "", self._path, line
+        )
 
-        return self.respond(
-            context=self, new_prompt="{}(configure)#".format(self._hostname)
+    def _prompt(self):
+        if not self._path:
+            return "{}(configure)#".format(self._hostname)
+        first = self._path[-1].split()[0]
+        return "{}(config-{})#".format(
+            self._hostname, SUBMODES.get(first, first)
         )
@@ -1,6 +1,7 @@
 """ A plugin for handling help and ?
 """
 from typing import Pattern
+from network_server.dispatch import CR
 from network_server.plugins import PluginBase
 
 
@@ -14,10 +15,16 @@ class Help(PluginBase):
         return ["help"]
 
     def keystrokes(self):
-        return [b"?"]
+        return ["?", "\t"]
 
     async def execute_command(self, line):
         self._logger.info("%s: %s", self._hostname, line)
+        output = self._table.cache.get("help")
+        if output is None:
+            output = self._table.cache["help"] = self._render()
+        return self.respond(output=output)
+
+    def _render(self):
         output = "\nGENERAL COMMANDS"
         output += "\n{:<20}{:<50}".format("exit", "Exit the session")
         output += "\n{:<20}{:<50}".format("help", "Get help")
@@ -38,7 +45,23 @@ class Help(PluginBase):
             )
             + "\n"
         )
-        return self.respond(output=output)
+        return output
 
-    def execute_keystroke(self, *args, **kwargs):
-        return self.execute_command("")
+    def execute_keystroke(self, key, line, pos):
+        if key == "\t":
+            completed = self._table.complete(line[:pos])
+            if completed is None:
+                return None
+            return "", completed + line[pos:], len(completed)
+        candidates = self._table.candidates(line[:pos])
+        if not candidates:
+            return "{}?\n% Unrecognized command\n".format(line), line, pos
+        if line[:pos] and not line[pos - 1].isspace():
+            listing = "  ".join(candidates)
+        else:
+            listing = "\n".join(
+                "  " + candidate for candidate in candidates if candidate != CR
+            )
+            if candidates[-1] == CR:
+                listing += ("\n" if listing else "") + "  " + CR
+        return "{}?\n{}\n".format(line, listing), line, pos
@@ -1,43 +1,63 @@
-""" A plugin for handling help and ?
+""" A plugin for the command history
 """
+from collections import deque
 import re
+import sys
 from network_server.plugins import PluginBase
 
 
 class History(PluginBase):
     """ history
+
+    The session hands every line entered to observe_command, the most
+    recent HISTORY_SIZE lines are kept. Lines are numbered from the
+    start of the session, so a number keeps referring to the same line
+    as older ones are dropped.
     """
 
     PLUGIN_HELP = "Show the command history."
+    HISTORY_SIZE = 100
 
     def __init__(self, *args, **kwargs):
         super(History, self).__init__(*args, **kwargs)
-        self._history = None
+        self._history = deque(maxlen=self.HISTORY_SIZE)
+        self._count = 0
 
     def commands(self):
         return ["history", re.compile(r"!\d+")]
 
-    # pylint: disable=W0212
+    def observe_command(self, line):
+        if line:
+            self._history.append(line)
+            self._count += 1
+
+    def footprint(self):
+        return (
+            super(History, self).footprint()
+            + sys.getsizeof(self._history)
+            + sum(sys.getsizeof(line) for line in self._history)
+        )
+
     async def execute_command(self, line):
         self._logger.info("%s: %s", self._hostname, line)
+        first = self._count - len(self._history)
         if line == "history":
-            self._history = self._process.channel._editor._history
-            rjust_amt = len(str(len(self._history))) + 1
+            rjust_amt = len(str(self._count)) + 1
             formatted_history = [
-                "{}  {}".format(str(idx).rjust(rjust_amt), cmd)
+                "{}  {}".format(str(first + idx).rjust(rjust_amt), cmd)
                 for idx, cmd in enumerate(self._history)
             ]
-            output = "\r\n".join(formatted_history) + "\r\n"
+            output = "\n".join(formatted_history) + "\n"
             return self.respond(output=output)
-        if re.match(r"!(?P<hnum>\d+)", line):
-            command = re.match(r"!(?P<hnum>\d+)", line)
-            cap = command.groupdict()
-            try:
-                history_command = self._history[int(cap["hnum"])]
-                self._process.channel._editor._line = history_command
-                self._process.channel._editor._update_input(
-                    0, len(self._process.channel._editor._line)
+        number = int(line[1:]) - first
+        # the !x line itself is the most recent entry
+        if 0 <= number < len(self._history) - 1:
+            history_command = self._history[number]
+            # the editor shows the line after the prompt, ready to edit
+            if getattr(self._process.channel, "_editor", None) is not None:
+                self._process.channel.set_input(
+                    history_command, len(history_command)
                 )
-            except IndexError:
-                self._process.channel._editor._ring_bell()
+        else:
+            self._process.stdout.write("\a")
         return self.respond()
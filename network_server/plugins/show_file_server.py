@@ -1,38 +1,112 @@
 """ A plugin for handling the show files
 """
 import logging
-from os.path import isfile, join, splitext
-from os import listdir
+import os
+from network_server.catalog import CATALOG
+from network_server.config_tree import OVERLAYS, RUNNING_CONFIG
+from network_server.content_cache import CONTENT_CACHE
 from network_server.plugins import PluginBase
-from concurrent.futures import ThreadPoolExecutor
-import asyncio
+from network_server.store import STORE
+from network_server.templates import TEMPLATES
 
 
 class ShowFileServer(PluginBase):
+    # files larger than this are streamed rather than cached
+    STREAM_THRESHOLD = 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+
     def __init__(self, *args, **kwargs):
         super(ShowFileServer, self).__init__(*args, **kwargs)
 
     def commands(self):
-        hostdir = "{}/{}".format(self._directory, self._hostname)
-        files = [
-            splitext(f)[0]
-            for f in listdir(hostdir)
-            if isfile(join(hostdir, f))
-        ]
-        return files
+        return CATALOG.commands(self._hostname)
 
     async def execute_command(self, line):
         self._logger.info("%s: %s", self._hostname, line)
         filename = "{}/{}/{}.txt".format(self._directory, self._hostname, line)
-        executor = ThreadPoolExecutor(max_workers=1)
-        loop = asyncio.get_event_loop()
-        content = await loop.run_in_executor(
-            executor, lambda: self._read_file(filename)
-        )
-        content = "\n" + "\n".join(content.splitlines()) + "\n"
+        content = await self.run_blocking(self._lookup, line, filename)
+        overlay = OVERLAYS.get(self._hostname)
+        if overlay and line == RUNNING_CONFIG:
+            if content is None:
+                content = await self.run_blocking(self.load_file, filename)
+            content = await self.run_blocking(
+                self._render_overlay, overlay, content
+            )
+        elif content is None:
+            content = self._stream_file(filename)
         return self.respond(output=content)
 
+    async def read(self, line):
+        """ the whole output of a command, as it is before any
+        configuration changes
+
+        :return: None if there is no output for the command
+        """
+        if line not in CATALOG.commands(self._hostname):
+            return None
+        filename = "{}/{}/{}.txt".format(self._directory, self._hostname, line)
+
+        def read():
+            content = self._lookup(line, filename)
+            return self.load_file(filename) if content is None else content
+
+        return await self.run_blocking(read)
+
+    def _render_overlay(self, overlay, content):
+        # the base content's hash is computed once and kept by the string
+        return CONTENT_CACHE.lookup(
+            (self._hostname, RUNNING_CONFIG, "overlay"),
+            (hash(content), len(content), overlay.version),
+            lambda: overlay.render(content),
+        )
+
+    def _lookup(self, line, filename):
+        template = CATALOG.template(self._hostname, line)
+        if template is not None:
+            return TEMPLATES.render(
+                template,
+                self._directory,
+                self._hostname,
+                self.username,
+                self.load_file,
+            )
+        if STORE.path:
+            # the store file's mtime and size validate the cached entry
+            return CONTENT_CACHE.get(
+                (self._hostname, line),
+                STORE.path,
+                lambda _path: STORE.read(self._hostname, line),
+            )
+        if os.stat(filename).st_size > self.STREAM_THRESHOLD:
+            return None
+        return CONTENT_CACHE.get(
+            (self._hostname, line), filename, self.load_file
+        )
+
+    async def _stream_file(self, filename):
+        """ yield a large file in chunks, the file is read as text so
+        line endings are normalized as it is read
+        """
+        fhand = await self.run_blocking(open, filename, "r")
+        try:
+            yield "\n"
+            last = "\n"
+            while True:
+                chunk = await self.run_blocking(fhand.read, self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                last = chunk[-1]
+                yield chunk
+            if last != "\n":
+                yield "\n"
+        finally:
+            fhand.close()
+
     @staticmethod
-    def _read_file(filename):
+    def load_file(filename):
+        """ read and normalize a file once, the result is cached and
+        written to the channel as is
+        """
         with open(filename, "r") as fhand:
-            return fhand.read()
+            content = fhand.read()
+        return "\n" + "\n".join(content.splitlines()) + "\n"
@@ -0,0 +1,61 @@
+""" A plugin for showing the mock server's own statistics
+"""
+from network_server.metrics import METRICS
+from network_server.plugins import PluginBase
+
+
+class Stats(PluginBase):
+    """ stats
+    """
+
+    PLUGIN_HELP = "Show the mock server statistics."
+
+    def commands(self):
+        return ["show mock stats"]
+
+    async def execute_command(self, line):
+        self._logger.info("%s: %s", self._hostname, line)
+        output = ["\nCOUNTERS"]
+        values = dict(METRICS.counters())
+        values.update(METRICS.gauges())
+        for (name, labels), value in sorted(values.items()):
+            label = ",".join("{}={}".format(*pair) for pair in labels)
+            output.append(
+                "{:<40}{:>20}".format(
+                    name + ("{" + label + "}" if label else ""), value
+                )
+            )
+        sessions = values.get(("mock_active_sessions", ()), 0)
+        if sessions:
+            output.append("\nMEMORY PER SESSION")
+            output.append(
+                "{:<40}{:>20}".format(
+                    "session state bytes",
+                    values[("mock_session_state_bytes", ())] // sessions,
+                )
+            )
+            output.append(
+                "{:<40}{:>20}".format(
+                    "process rss bytes",
+                    values[("mock_rss_bytes", ())] // sessions,
+                )
+            )
+        output.append("\nLATENCY")
+        output.append(
+            "{:<20}{:<40}{:>10}{:>10}{:>10}".format(
+                "plugin", "command", "count", "p50 ms", "p99 ms"
+            )
+        )
+        histograms = METRICS.histograms("mock_command_seconds")
+        for labels, histogram in sorted(histograms.items()):
+            labels = dict(labels)
+            output.append(
+                "{:<20}{:<40}{:>10}{:>10.2f}{:>10.2f}".format(
+                    labels["plugin"][:19],
+                    labels["command"][:39],
+                    histogram.count,
+                    histogram.quantile(0.5) * 1000,
+                    histogram.quantile(0.99) * 1000,
+                )
+            )
+        return self.respond(output="\n".join(output) + "\n")
@@ -0,0 +1,130 @@
+""" A single file, indexed store of device command output
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    content BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    hostname TEXT NOT NULL,
+    command TEXT NOT NULL,
+    digest TEXT NOT NULL REFERENCES blobs (digest),
+    PRIMARY KEY (hostname, command)
+);
+"""
+
+
+class FixtureStore:
+    """ device command output packed into one sqlite file
+
+    The output is stored already normalized, the way ShowFileServer
+    sends it, and content addressed: each distinct output is stored once
+    by its sha256 digest and devices index their commands to a digest.
+    Each thread reading from the store gets its own read only
+    connection, which is reopened when the file is replaced.
+    """
+
+    def __init__(self):
+        self.path = None
+        self._local = threading.local()
+
+    def open(self, path):
+        if not os.path.isfile(path):
+            raise FileNotFoundError("No such store: '{}'".format(path))
+        self.path = path
+
+    def _connect(self):
+        return sqlite3.connect(
+            "file:{}?mode=ro".format(self.path), uri=True
+        )
+
+    def _connection(self):
+        inode = os.stat(self.path).st_ino
+        if getattr(self._local, "inode", None) != inode:
+            if getattr(self._local, "connection", None) is not None:
+                self._local.connection.close()
+            self._local.connection = self._connect()
+            self._local.inode = inode
+        return self._local.connection
+
+    def index(self):
+        """ every device and its commands, read with a single query
+        """
+        devices = {}
+        connection = self._connect()
+        try:
+            for hostname, command in connection.execute(
+                "SELECT hostname, command FROM outputs ORDER BY hostname"
+            ):
+                devices.setdefault(hostname, []).append(command)
+        finally:
+            connection.close()
+        return {
+            hostname: tuple(commands)
+            for hostname, commands in devices.items()
+        }
+
+    def read(self, hostname, command):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT content FROM outputs JOIN blobs USING (digest)"
+                " WHERE hostname = ? AND command = ?",
+                (hostname, command),
+            )
+            .fetchone()
+        )
+        if row is None:
+            raise KeyError((hostname, command))
+        return row[0].decode("utf-8")
+
+    @staticmethod
+    def pack(path, outputs):
+        """ write a new store to path from (hostname, command, content)
+
+        The store is written next to path and moved into place so
+        running servers never see a partial file.
+
+        :return: the output and byte counts, before and after deduplication
+        """
+        counts = {
+            "outputs": 0,
+            "unique_outputs": 0,
+            "bytes": 0,
+            "unique_bytes": 0,
+        }
+        tmp_path = "{}.tmp".format(path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        connection = sqlite3.connect(tmp_path)
+        try:
+            connection.executescript(SCHEMA)
+            for hostname, command, content in outputs:
+                encoded = content.encode("utf-8")
+                digest = hashlib.sha256(encoded).hexdigest()
+                inserted = connection.execute(
+                    "INSERT OR IGNORE INTO blobs VALUES (?, ?)",
+                    (digest, encoded),
+                ).rowcount
+                connection.execute(
+                    "INSERT INTO outputs VALUES (?, ?, ?)",
+                    (hostname, command, digest),
+                )
+                counts["outputs"] += 1
+                counts["bytes"] += len(encoded)
+                if inserted:
+                    counts["unique_outputs"] += 1
+                    counts["unique_bytes"] += len(encoded)
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(tmp_path, path)
+        return counts
+
+
+STORE = FixtureStore()
@@ -0,0 +1,94 @@
+""" Fixture templates, one file rendered for many devices
+"""
+import json
+import os
+from string import Template
+import threading
+
+from network_server.content_cache import CONTENT_CACHE
+
+VARS_FILE = "vars.json"
+
+
+def _signature(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class FixtureTemplates:
+    """ compiled templates and device variables
+
+    Templates use string.Template syntax, `$hostname` or `${serial}`.
+    Each template file is compiled once and each device's variables
+    file is parsed once, both are reloaded when the file changes. The
+    rendered output is held in the content cache per device, so a
+    template is only substituted again when the template or the
+    device's variables change.
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._variables = {}
+        self._lock = threading.Lock()
+
+    def _compiled(self, filename, signature, loader):
+        with self._lock:
+            cached = self._templates.get(filename)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        template = Template(loader(filename))
+        with self._lock:
+            self._templates[filename] = (signature, template)
+        return template
+
+    def _device_variables(self, filename, signature):
+        if signature is None:
+            return {}
+        with self._lock:
+            cached = self._variables.get(filename)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with open(filename) as fhand:
+            variables = json.load(fhand)
+        with self._lock:
+            self._variables[filename] = (signature, variables)
+        return variables
+
+    def render(self, filename, directory, hostname, username, loader):
+        """ render a template for a device
+
+        :param filename: the template file
+        :param directory: the device/commands directory, the device's
+            variables are read from <directory>/<hostname>/vars.json
+        :param loader: called with filename to read and normalize the
+            template source
+        :return: the rendered output, unknown variables are left as is
+        """
+        vars_file = os.path.join(directory, hostname, VARS_FILE)
+        template_signature = _signature(filename)
+        vars_signature = _signature(vars_file)
+
+        def _render():
+            variables = {"hostname": hostname, "username": username}
+            variables.update(
+                self._device_variables(vars_file, vars_signature)
+            )
+            template = self._compiled(filename, template_signature, loader)
+            return template.safe_substitute(variables)
+
+        return CONTENT_CACHE.lookup(
+            (hostname, filename, username),
+            (template_signature, vars_signature),
+            _render,
+        )
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self._variables.clear()
+
+
+TEMPLATES = FixtureTemplates()
@@ -0,0 +1,145 @@
+""" Emulate the response time and output rate of real devices
+"""
+import asyncio
+from fnmatch import fnmatchcase
+from functools import lru_cache
+import json
+import math
+import random
+
+# how often paced output is written
+TICK = 0.05
+
+
+def _sampler(spec):
+    """ a function returning a latency in seconds
+
+    :param spec: a number of seconds, or a dict with a 'distribution'
+        of fixed (value), uniform (min, max), normal (mean, stddev),
+        lognormal (median, sigma) or exponential (mean), and an
+        optional 'max'
+    """
+    if spec is None:
+        return lambda: 0.0
+    if isinstance(spec, (int, float)):
+        value = float(spec)
+        return lambda: value
+    kind = spec.get("distribution", "fixed")
+    if kind == "fixed":
+        value = float(spec["value"])
+        sample = lambda: value
+    elif kind == "uniform":
+        low, high = float(spec["min"]), float(spec["max"])
+        sample = lambda: random.uniform(low, high)
+    elif kind == "normal":
+        mean, stddev = float(spec["mean"]), float(spec["stddev"])
+        sample = lambda: max(0.0, random.gauss(mean, stddev))
+    elif kind == "lognormal":
+        mu, sigma = math.log(float(spec["median"])), float(spec["sigma"])
+        sample = lambda: random.lognormvariate(mu, sigma)
+    elif kind == "exponential":
+        lambd = 1 / float(spec["mean"])
+        sample = lambda: random.expovariate(lambd)
+    else:
+        raise ValueError("Unknown latency distribution '{}'".format(kind))
+    if "max" in spec and kind != "uniform":
+        limit = float(spec["max"])
+        return lambda: min(limit, sample())
+    return sample
+
+
+class Timing:
+    """ the timing of one device command
+    """
+
+    __slots__ = ("delay", "rate")
+
+    def __init__(self, spec):
+        # returns the seconds before the output starts
+        self.delay = _sampler(spec.get("latency"))
+        # output bytes per second, 0 for as fast as the client reads
+        self.rate = float(spec.get("rate", 0))
+
+
+class TimingProfiles:
+    """ timing profiles loaded from a json file
+
+    The first rule whose 'device' and 'command' glob patterns match is
+    used, then 'default'. Without a file no timing is applied.
+
+    {
+      "default": {"latency": 0.05},
+      "rules": [
+        {"device": "ios*", "command": "show running-config",
+         "latency": {"distribution": "lognormal", "median": 0.5,
+                     "sigma": 0.5, "max": 2},
+         "rate": 20000}
+      ]
+    }
+    """
+
+    def __init__(self):
+        self._rules = []
+        self.profile = lambda hostname, command: None
+
+    def load(self, path):
+        with open(path) as fhand:
+            config = json.load(fhand)
+        rules = [
+            (
+                rule.get("device", "*"),
+                rule.get("command", "*"),
+                Timing(rule),
+            )
+            for rule in config.get("rules", [])
+        ]
+        if "default" in config:
+            rules.append(("*", "*", Timing(config["default"])))
+        self._rules = rules
+        self.profile = lru_cache(maxsize=65536)(self._match)
+
+    def _match(self, hostname, command):
+        """ the Timing for a device command, or None
+        """
+        for device, pattern, timing in self._rules:
+            if fnmatchcase(hostname, device) and fnmatchcase(command, pattern):
+                return timing
+        return None
+
+
+async def paced(output, rate):
+    """ re-chunk a string or an async iterator of strings so it is
+    written at rate bytes per second
+
+    Each chunk is scheduled against the start time, so the rate holds
+    however long the writes take.
+    """
+    size = max(1, int(rate * TICK))
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    sent = 0
+
+    async def chunks():
+        if isinstance(output, str):
+            yield output
+            return
+        async for chunk in output:
+            yield chunk
+
+    try:
+        async for chunk in chunks():
+            for idx in range(0, len(chunk), size):
+                delay = start + sent / rate - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                piece = chunk[idx : idx + size]
+                yield piece
+                sent += len(piece)
+    finally:
+        # strings and plain async iterators have nothing to close
+        close = getattr(output, "aclose", None)
+        if close is not None:
+            await close()
+
+
+TIMING = TimingProfiles()
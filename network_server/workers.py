@@ -0,0 +1,108 @@
+""" Run the ssh listeners across several worker processes
+"""
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+import signal
+import time
+
+
+class Supervisor:
+    """ fork the workers, restart the ones that die and stop them all
+    on SIGINT or SIGTERM
+    """
+
+    RESTART_DELAY = 1
+    STOP_TIMEOUT = 5
+
+    def __init__(self, target, ports, workers, reuse_port=False):
+        """
+        :param target: called in each worker with the list of ports and
+            the worker index
+        :param ports: all the listener ports
+        :param workers: the number of worker processes
+        :param reuse_port: every worker listens on every port with
+            SO_REUSEPORT, otherwise the ports are split among the workers
+        """
+        self._target = target
+        self._logger = logging.getLogger(self.__class__.__name__)
+        if reuse_port:
+            self._partitions = [ports] * workers
+        else:
+            if workers > len(ports):
+                self._logger.warning(
+                    "Starting %s workers rather than %s, one per port,"
+                    " use --reuse-port to share the ports between more",
+                    len(ports),
+                    workers,
+                )
+                workers = len(ports)
+            self._partitions = [ports[idx::workers] for idx in range(workers)]
+        self._context = multiprocessing.get_context("fork")
+        self._processes = {}
+        self._stopping = False
+
+    def run(self):
+        """ start the workers and supervise them until stopped
+        """
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        for idx in range(len(self._partitions)):
+            self._start(idx)
+        while not self._stopping:
+            sentinels = {
+                process.sentinel: idx
+                for idx, process in self._processes.items()
+            }
+            for sentinel in wait(list(sentinels), timeout=1):
+                idx = sentinels[sentinel]
+                process = self._processes[idx]
+                process.join()
+                if self._stopping:
+                    break
+                self._logger.error(
+                    "Worker %s (pid %s) exited with %s, restarting",
+                    idx,
+                    process.pid,
+                    process.exitcode,
+                )
+                time.sleep(self.RESTART_DELAY)
+                self._start(idx)
+        self._shutdown()
+
+    def _start(self, idx):
+        process = self._context.Process(
+            target=self._worker,
+            args=(self._partitions[idx], idx),
+            name="worker-{}".format(idx),
+            daemon=True,
+        )
+        process.start()
+        self._processes[idx] = process
+        self._logger.info(
+            "Started worker %s (pid %s) for ports %s",
+            idx,
+            process.pid,
+            ",".join(str(port) for port in self._partitions[idx]),
+        )
+
+    def _worker(self, ports, idx):
+        # the supervisor handles ^C for the whole process group
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self._target(ports, idx)
+
+    def _stop(self, *_args):
+        self._stopping = True
+
+    def _shutdown(self):
+        self._logger.info("Stopping %s workers", len(self._processes))
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.STOP_TIMEOUT
+        for process in self._processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
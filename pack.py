@@ -0,0 +1,82 @@
+import argparse
+import logging
+import os
+from network_server.catalog import FLEET, SUFFIX
+from network_server.plugins.show_file_server import ShowFileServer
+from network_server.store import FixtureStore
+
+
+def _parse_args():
+    """ Entrypoint
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument(
+        "-d",
+        "--directory",
+        default="./examples/configs",
+        help="The path to the device/commands directories to pack.",
+    )
+
+    parser.add_argument(
+        "-s", "--store", help="The store file to write.", required=True
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+def _outputs(directory, devices, skipped):
+    """ the device outputs to pack
+
+    Only .txt outputs are packed, other files such as templates and
+    vars.json are added to skipped.
+    """
+    for hostname in sorted(os.listdir(directory)):
+        hostdir = os.path.join(directory, hostname)
+        if hostname == FLEET or not os.path.isdir(hostdir):
+            continue
+        devices.append(hostname)
+        for filename in sorted(os.listdir(hostdir)):
+            path = os.path.join(hostdir, filename)
+            if not os.path.isfile(path):
+                continue
+            if not filename.endswith(SUFFIX):
+                skipped.append(path)
+                continue
+            content = ShowFileServer.load_file(path)
+            yield hostname, filename[: -len(SUFFIX)], content
+
+
+def main():
+    args = _parse_args()
+    devices = []
+    skipped = []
+    counts = FixtureStore.pack(
+        args.store, _outputs(args.directory, devices, skipped)
+    )
+    for path in skipped:
+        LOGGER.warning("Skipped '%s', only .txt outputs are packed", path)
+    LOGGER.info(
+        "Packed %s outputs from %s devices into '%s' (%s bytes)",
+        counts["outputs"],
+        len(devices),
+        args.store,
+        os.path.getsize(args.store),
+    )
+    LOGGER.info(
+        "%s unique outputs, %s bytes stored as %s bytes,"
+        " dedup ratio %.2f",
+        counts["unique_outputs"],
+        counts["bytes"],
+        counts["unique_bytes"],
+        counts["bytes"] / (counts["unique_bytes"] or 1),
+    )
+
+
+if __name__ == "__main__":
+    LOGGER = logging.getLogger()
+    logging.basicConfig(level=logging.INFO)
+    main()
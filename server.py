@@ -1,9 +1,22 @@
 import argparse
 import logging
 import asyncio
+import functools
+import signal
 import sys
 import asyncssh
-from network_server.asyncssh_server import start_server
+from network_server.admission import ADMISSION
+from network_server.asyncssh_server import server_options, start_server
+from network_server.catalog import CATALOG
+from network_server.content_cache import CONTENT_CACHE
+from network_server.executor import EXECUTOR
+from network_server.logs import configure_logging
+from network_server.metrics import serve_metrics
+from network_server.plugins.history import History
+from network_server.plugins.show_file_server import ShowFileServer
+from network_server.store import STORE
+from network_server.timing import TIMING
+from network_server.workers import Supervisor
 import concurrent.futures
 
 
@@ -29,6 +42,13 @@ def _parse_args():
         help="The path to the device/commands directories.",
     )
 
+    parser.add_argument(
+        "-s",
+        "--store",
+        default=None,
+        help="A packed store to serve instead of the directory.",
+    )
+
     parser.add_argument(
         "-p",
         "--password",
@@ -41,7 +61,7 @@ def _parse_args():
         "--enable-plugins",
         type=lambda s: [item for item in s.split(",")],
         help="The plugins that should be enabled",
-        default="confmode,help,history,showfs",
+        default="confmode,help,history,showfs,stats",
     )
 
     parser.add_argument(
@@ -57,7 +77,207 @@ def _parse_args():
     )
 
     parser.add_argument(
-        "-k", "--ssh_key", help="Server side SSH key file path", required=True
+        "-k",
+        "--ssh_key",
+        default=None,
+        help="Server side SSH key file path, a key is generated when omitted",
+    )
+
+    parser.add_argument(
+        "--host-key-type",
+        default="ssh-ed25519",
+        help="The type of the host key generated when no key file is given.",
+    )
+
+    parser.add_argument(
+        "--kex-algs",
+        type=lambda s: [item for item in s.split(",")],
+        default=None,
+        help="The key exchange algorithms, in order of preference.",
+    )
+
+    parser.add_argument(
+        "--encryption-algs",
+        type=lambda s: [item for item in s.split(",")],
+        default=None,
+        help="The encryption algorithms, in order of preference,"
+        " e.g. 'chacha20-poly1305@openssh.com,aes128-gcm@openssh.com'.",
+    )
+
+    parser.add_argument(
+        "--mac-algs",
+        type=lambda s: [item for item in s.split(",")],
+        default=None,
+        help="The MAC algorithms, in order of preference.",
+    )
+
+    parser.add_argument(
+        "--no-line-editor",
+        dest="line_editor",
+        action="store_false",
+        help="Disable input line editing and echo for every session.",
+    )
+
+    parser.add_argument(
+        "--max-sessions",
+        default=0,
+        type=int,
+        help="The most concurrent connections, 0 for no limit.",
+    )
+
+    parser.add_argument(
+        "--max-listener-sessions",
+        default=0,
+        type=int,
+        help="The most concurrent connections per port, 0 for no limit.",
+    )
+
+    parser.add_argument(
+        "--max-device-sessions",
+        default=0,
+        type=int,
+        help="The most concurrent sessions per device, 0 for no limit.",
+    )
+
+    parser.add_argument(
+        "--idle-timeout",
+        default=0,
+        type=float,
+        help="Close sessions idle for this many seconds, 0 to never.",
+    )
+
+    parser.add_argument(
+        "--keepalive-interval",
+        default=0,
+        type=float,
+        help="Seconds between keepalives, unresponsive clients are"
+        " disconnected. 0 to disable.",
+    )
+
+    parser.add_argument(
+        "--command-rate",
+        default=0,
+        type=float,
+        help="The commands per second allowed per client address,"
+        " 0 for no limit.",
+    )
+
+    parser.add_argument(
+        "--command-burst",
+        default=0,
+        type=int,
+        help="The commands a client may send at once before the rate"
+        " applies, defaults to the rate rounded up.",
+    )
+
+    parser.add_argument(
+        "--timing",
+        default=None,
+        help="A json file of per device and command latency and output"
+        " rate profiles.",
+    )
+
+    parser.add_argument(
+        "--history-size",
+        default=100,
+        type=int,
+        help="The command history lines kept per session.",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        default=64 * 1024 * 1024,
+        type=int,
+        help="The byte budget for the shared command output cache.",
+    )
+
+    parser.add_argument(
+        "--executor-threads",
+        default=16,
+        type=int,
+        help="The threads for blocking file and subprocess work.",
+    )
+
+    parser.add_argument(
+        "--executor-queue",
+        default=256,
+        type=int,
+        help="The most calls queued for the threads, more wait their turn.",
+    )
+
+    parser.add_argument(
+        "--stream-threshold",
+        default=1024 * 1024,
+        type=int,
+        help="Files larger than this many bytes are streamed, not cached.",
+    )
+
+    parser.add_argument(
+        "--rescan-interval",
+        default=5,
+        type=float,
+        help="Seconds between rescans of the directory, 0 to disable.",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        default=1,
+        type=int,
+        help="The number of worker processes to split the servers across.",
+    )
+
+    parser.add_argument(
+        "--reuse-port",
+        action="store_true",
+        help="Have every worker listen on every port using SO_REUSEPORT.",
+    )
+
+    parser.add_argument(
+        "-m",
+        "--metrics-port",
+        default=None,
+        type=int,
+        help="Serve prometheus metrics on this local port, each worker"
+        " uses the next port.",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        default="DEBUG",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="The root log level.",
+    )
+
+    parser.add_argument(
+        "--log-format",
+        default="text",
+        choices=["text", "json"],
+        help="Log as plain text or as one json object per line.",
+    )
+
+    parser.add_argument(
+        "--log-background",
+        action="store_true",
+        help="Format and write log records in a background thread.",
+    )
+
+    parser.add_argument(
+        "--log-sample",
+        type=lambda s: {
+            name: float(rate)
+            for name, rate in (item.split("=") for item in s.split(","))
+        },
+        default=None,
+        help="The fraction of records kept per logger,"
+        " e.g. 'asyncssh=0.01,ShowFileServer=0.1'.",
+    )
+
+    parser.add_argument(
+        "--log-rate-limit",
+        default=None,
+        type=float,
+        help="The most log records per second per logger.",
     )
 
     args = parser.parse_args()
@@ -66,13 +286,64 @@ def _parse_args():
 
 def main():
     args = _parse_args()
-    loop = asyncio.get_event_loop()
-    for item in range(0, args.server_count):
-        loop.create_task(start_server(args.base_port + item, **vars(args)))
-    loop.run_forever()
+    configure_logging(
+        level=args.log_level,
+        log_format=args.log_format,
+        background=args.log_background,
+        sample=args.log_sample,
+        rate_limit=args.log_rate_limit,
+    )
+    CONTENT_CACHE.max_bytes = args.cache_size
+    EXECUTOR.configure(args.executor_threads, args.executor_queue)
+    ADMISSION.configure(
+        max_sessions=args.max_sessions,
+        max_listener_sessions=args.max_listener_sessions,
+        max_device_sessions=args.max_device_sessions,
+        idle_timeout=args.idle_timeout,
+        command_rate=args.command_rate,
+        command_burst=args.command_burst,
+    )
+    ShowFileServer.STREAM_THRESHOLD = args.stream_threshold
+    History.HISTORY_SIZE = args.history_size
+    if args.timing:
+        TIMING.load(args.timing)
+    if args.store:
+        STORE.open(args.store)
+        CATALOG.load(args.directory, store=STORE)
+    else:
+        CATALOG.load(args.directory)
+    options = server_options(**vars(args))
+    ports = [args.base_port + item for item in range(0, args.server_count)]
+    if args.workers > 1:
+        supervisor = Supervisor(
+            functools.partial(_serve, args, options),
+            ports,
+            args.workers,
+            reuse_port=args.reuse_port,
+        )
+        supervisor.run()
+    else:
+        _serve(args, options, ports)
+
+
+def _serve(args, options, ports, worker=0):
+    """ run the servers for ports on an event loop until SIGTERM
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    if args.rescan_interval:
+        loop.create_task(CATALOG.watch(args.rescan_interval))
+    if args.metrics_port:
+        loop.create_task(serve_metrics(args.metrics_port + worker))
+    for port in ports:
+        loop.create_task(start_server(port, options=options, **vars(args)))
+    try:
+        loop.run_forever()
+    finally:
+        EXECUTOR.shutdown()
 
 
 if __name__ == "__main__":
     LOGGER = logging.getLogger()
-    logging.basicConfig(level=logging.DEBUG)
     main()
@@ -0,0 +1,57 @@
+""" command table sharing between the sessions of a device
+"""
+import os
+
+import network_server
+from network_server import TABLES, SSHSession, command_table
+from network_server.catalog import CATALOG
+
+DIRECTORY = os.path.join(
+    os.path.dirname(__file__), "..", "examples", "configs"
+)
+PLUGINS = "confmode,help,history,showfs,stats".split(",")
+
+
+class FakeProcess:
+    def get_extra_info(self, name):
+        return {"client": "127.0.0.1"}.get(name)
+
+
+def setup_module():
+    CATALOG.load(DIRECTORY)
+    TABLES.clear()
+
+
+def test_command_table_is_cached():
+    first = command_table("nxos101", PLUGINS, DIRECTORY)
+    second = command_table("nxos101", PLUGINS, DIRECTORY)
+    assert first is second
+    assert list(TABLES) == [("nxos101", tuple(PLUGINS))]
+
+
+def test_sessions_share_the_table():
+    sessions = [
+        SSHSession(
+            "admin",
+            "nxos101",
+            FakeProcess(),
+            directory=DIRECTORY,
+            enable_plugins=PLUGINS,
+        )
+        for _ in range(2)
+    ]
+    # pylint: disable=W0212
+    assert sessions[0]._table is sessions[1]._table
+    assert sessions[0]._prompt is sessions[1]._prompt
+
+
+def test_unlisted_tables_are_bounded(monkeypatch):
+    monkeypatch.setattr(network_server, "UNLISTED_TABLES", 2)
+    listed = command_table("nxos101", PLUGINS, DIRECTORY)
+    tables = [
+        command_table("made-up-{}".format(idx), PLUGINS, DIRECTORY)
+        for idx in range(3)
+    ]
+    assert ("made-up-0", tuple(PLUGINS)) not in TABLES
+    assert command_table("made-up-2", PLUGINS, DIRECTORY) is tables[2]
+    assert command_table("nxos101", PLUGINS, DIRECTORY) is listed
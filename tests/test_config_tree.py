@@ -0,0 +1,92 @@
+""" configure mode changes applied over the base running-config
+"""
+from network_server.config_tree import ConfigOverlay
+
+BASE = """hostname r1
+interface Gi1
+ description uplink
+ ip address 10.0.0.1 255.255.255.0
+ no shutdown
+interface Loopback5
+ ip address 10.5.5.5 255.255.255.255
+router bgp 65000
+ address-family ipv4
+  network 10.0.0.0
+end
+"""
+
+
+def _apply(lines, base=BASE):
+    overlay = ConfigOverlay()
+    path = ()
+    paths = []
+    for line in lines:
+        path = overlay.apply(base, path, line)
+        paths.append(path)
+    return overlay, paths
+
+
+def test_section_paths():
+    _overlay, paths = _apply(
+        [
+            "interface Gi1",
+            "description core",
+            "router bgp 65000",
+            "address-family ipv4",
+            "network 10.1.0.0",
+            "hostname r2",
+        ]
+    )
+    assert paths == [
+        ("interface Gi1",),
+        ("interface Gi1",),
+        ("router bgp 65000",),
+        ("router bgp 65000", "address-family ipv4"),
+        ("router bgp 65000", "address-family ipv4"),
+        ("router bgp 65000", "address-family ipv4"),
+    ]
+
+
+def test_single_valued_settings_are_replaced():
+    overlay, _paths = _apply(
+        ["hostname r2", "interface Gi1", "description core", "shutdown"]
+    )
+    # changes are added at the end of their section
+    assert overlay.render(BASE) == (
+        "\ninterface Gi1\n"
+        " ip address 10.0.0.1 255.255.255.0\n"
+        " description core\n"
+        " shutdown\n"
+        "interface Loopback5\n"
+        " ip address 10.5.5.5 255.255.255.255\n"
+        "router bgp 65000\n"
+        " address-family ipv4\n"
+        "  network 10.0.0.0\n"
+        "hostname r2\n"
+        "end\n"
+    )
+
+
+def test_no_top_level_section_from_another_section():
+    overlay, paths = _apply(
+        ["interface Gi1", "no interface Loopback5", "no ip address"]
+    )
+    assert paths == [("interface Gi1",), (), ()]
+    rendered = overlay.render(BASE)
+    assert "Loopback5" not in rendered
+    assert " ip address 10.0.0.1 255.255.255.0\n" in rendered
+
+
+def test_new_sections_go_before_end():
+    overlay, _paths = _apply(["interface Gi3", "description new"])
+    assert overlay.render(BASE).endswith(
+        "interface Gi3\n description new\nend\n"
+    )
+
+
+def test_reverting_a_change_leaves_no_overlay():
+    overlay, _paths = _apply(
+        ["interface Gi1", "no description uplink", "description uplink"]
+    )
+    assert not overlay
+    assert overlay.render(BASE) == "\n" + BASE
@@ -0,0 +1,36 @@
+""" command table dispatch of plugin patterns
+"""
+import re
+
+from network_server.dispatch import CommandTable
+
+
+def test_unmergeable_patterns_keep_their_meaning():
+    table = CommandTable(
+        {
+            re.compile(r"(?P<word>\w+) one"): "named",
+            re.compile(r"(?P<word>\w+) two"): "same name",
+            re.compile(r"(\w)\1 three"): "backreference",
+            re.compile(r"four five", re.VERBOSE): "verbose",
+            re.compile(r"(?i)six seven"): "global flag",
+            re.compile(r"conf.*"): "merged",
+        }
+    )
+    assert table.lookup("a one") == ("a one", "named")
+    assert table.lookup("a two") == ("a two", "same name")
+    assert table.lookup("aa three") == ("aa three", "backreference")
+    assert table.lookup("ab three") is None
+    assert table.lookup("fourfive") == ("fourfive", "verbose")
+    assert table.lookup("SIX seven") == ("SIX seven", "global flag")
+    assert table.lookup("configure") == ("configure", "merged")
+
+
+def test_first_matching_pattern_wins():
+    table = CommandTable(
+        {
+            re.compile(r"show (\w)\1"): "first",
+            re.compile(r"show.*"): "second",
+        }
+    )
+    assert table.lookup("show aa") == ("show aa", "first")
+    assert table.lookup("show ab") == ("show ab", "second")
@@ -0,0 +1,70 @@
+""" trailing pipe filters over command output
+"""
+import asyncio
+
+from network_server.filters import split_pipe
+
+OUTPUT = """
+hostname r1
+interface Gi1
+ description uplink
+ shutdown
+interface Gi2
+ description downlink
+end
+"""
+
+
+def _filter(line):
+    _base, line_filter = split_pipe(line)
+    return line_filter
+
+
+def _stream(line_filter, chunks):
+    async def output():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return "".join([chunk async for chunk in line_filter.apply(output())])
+
+    return asyncio.run(collect())
+
+
+def test_split_pipe():
+    base, line_filter = split_pipe("sh run | i desc")
+    assert base == "sh run"
+    assert line_filter.name == "include"
+    assert split_pipe("show run | e desc") is not None
+    assert split_pipe("show run | zzz desc") is None
+    assert split_pipe("show run | include") is None
+    assert split_pipe("show run | include [") is None
+
+
+def test_filters():
+    assert _filter("x | include desc").apply(OUTPUT) == (
+        "\n description uplink\n description downlink\n"
+    )
+    assert _filter("x | exclude desc|shut").apply(OUTPUT) == (
+        "\nhostname r1\ninterface Gi1\ninterface Gi2\nend\n"
+    )
+    assert _filter("x | begin Gi2").apply(OUTPUT) == (
+        "\ninterface Gi2\n description downlink\nend\n"
+    )
+    assert _filter("x | section Gi1").apply(OUTPUT) == (
+        "\ninterface Gi1\n description uplink\n shutdown\n"
+    )
+    assert _filter("x | count desc").apply(OUTPUT) == (
+        "\nNumber of lines which match regexp = 2\n"
+    )
+
+
+def test_lines_split_across_chunks():
+    chunks = [OUTPUT[idx : idx + 7] for idx in range(0, len(OUTPUT), 7)]
+    for line in ("x | include desc", "x | section Gi1", "x | count desc"):
+        assert _stream(_filter(line), chunks) == _filter(line).apply(OUTPUT)
+
+
+def test_last_line_without_newline():
+    chunks = ["\nhost", "name r1\nen", "d"]
+    assert _stream(_filter("x | include end"), chunks) == "\nend\n"